@@ -6,18 +6,33 @@ import pandas as pd
 import numpy as np
 import datetime as dt
 import os
-import csv
 import time
+import math
 from pytz import timezone
 import logging
 import copy
+import asyncio
 import concurrent.futures
+import multiprocessing
+import queue
+import signal
+import threading
 
 from ibapi.client import EClient
+from ibapi.async_client import AsyncEClient
 from ibapi.wrapper import EWrapper
 from ibapi.contract import Contract
 from ibapi.ticktype import TickTypeEnum
 from ibapi.order import Order
+from ibapi.message import IN
+from ibapi.utils import (setHotPathLogging, setWireTrace)
+
+from gateway import SharedGateway
+from candles import (BarEngine, TickBarEngine, TradingCalendar, CandleStore)
+from strategy import load_strategy
+from journal import (
+    open_journal, open_events, claim_events, claim_recorder, release_claims, flush_journals, EventJournal)
+from logqueue import (setup_logging, tick_logger, LocalTime)
 
 pd.set_option('display.max_colwidth', 10)
 pd.set_option('display.float_format', lambda x: '%.f' % x)
@@ -55,15 +70,33 @@ class MarketDataApp(EClient, EWrapper):
         args (obj):           runtime args, passed in from user (cli/gui)
         start_order_id (int): order IDs are incremented starting from this
             If start_order_id == None, then use self.reqIds() to increment order Ids
+        gateway (obj):        optional gateway.SharedGateway. If given, attach to its
+            connection instead of opening one of our own. client_id and
+            start_order_id are then unused, order IDs come from the gateway
     """
 
     RT_BAR_PERIOD = 5
-    def __init__(self, client_id, args, start_order_id=None):
-        EClient.__init__(self, self)
+    # Msgs handled below. Everything else is dropped before decoding
+    MSG_INTEREST = (
+        IN.TICK_PRICE, IN.TICK_BY_TICK, IN.REAL_TIME_BARS, IN.HISTORICAL_DATA,
+        IN.ORDER_STATUS, IN.OPEN_ORDER, IN.OPEN_ORDER_END, IN.EXECUTION_DATA,
+        IN.NEXT_VALID_ID, IN.POSITION_DATA, IN.CONTRACT_DATA)
+    # Historical bar sizes for the warm-up, largest first. Larger sizes are
+    # aligned to the session open rather than the clock, so are not used
+    HISTORICAL_BAR_SIZES = (
+        (1800, '30 mins'), (1200, '20 mins'), (900, '15 mins'), (600, '10 mins'),
+        (300, '5 mins'), (180, '3 mins'), (120, '2 mins'), (60, '1 min'),
+        (30, '30 secs'), (15, '15 secs'), (10, '10 secs'), (5, '5 secs'))
+    def __init__(self, client_id, args, start_order_id=None, gateway=None, bar_engine=None):
+        EClient.__init__(self, self, fastDecode=True, batchHistorical=True)
+        self.setMsgInterest(MarketDataApp.msg_interest(args))
         self.client_id = client_id
         self.args = args
         self.start_order_id = start_order_id
+        self.gateway = gateway
         self.logger = logging.getLogger(__name__)
+        # Per tick/bar messages: lazily formatted and rate limited
+        self.tick_logger = tick_logger(f'{__name__}.ticks.{args.symbol}')
 
         self.debug_mode = False
         if args.debug:
@@ -75,22 +108,30 @@ class MarketDataApp(EClient, EWrapper):
             f' order_type: {self.args.order_type},'
             f' quote_type: {self.args.quote_type},'
             f' order_size: {self.args.order_size},'
-            f' bar_period: {self.args.bar_period}')
+            f' bar_period: {self.args.bar_period},'
+            f' bar_source: {self.args.bar_source},'
+            f' strategy: {self.args.strategy},'
+            f' warm_up: {self.args.warm_up}')
 
-        self.logfile_candles = 'logs/log_candles.csv'
+        self.logfile_candles = self.args.candles_csv
         logfile_candles_rows = ('time', 'symbol', 'open', 'high', 'low', 'close', 'ha_open', 'ha_close', 'ha_high', 'ha_low', 'ha_color')
-        self.logfile_orders = 'logs/log_orders.csv'
+        self.logfile_orders = self.args.orders_csv
         logfile_orders_rows = ('time', 'order_id', 'symbol', 'side', 'order_type', 'size', 'price')
-        if not os.path.isdir('logs/'):
-            os.makedirs('logs')
-        if not os.path.exists(self.logfile_candles):
-            self._write_csv_row((logfile_candles_rows,), self.logfile_candles, newfile=True)
-        else:
-            self._write_csv_row((('', '', '', '', '', '', '', '', '', '', ''),), self.logfile_candles)
-        if not os.path.exists(self.logfile_orders):
-            self._write_csv_row((logfile_orders_rows,), self.logfile_orders, newfile=True)
-        else:
-            self._write_csv_row((('', '', '', '', '', '', ''),), self.logfile_orders,)
+        # Shared by all apps of the process, and written by a background thread
+        self.candles_journal = open_journal(
+            self.logfile_candles, logfile_candles_rows,
+            flush_secs=self.args.journal_flush, fsync=self.args.journal_fsync)
+        self.orders_journal = open_journal(
+            self.logfile_orders, logfile_orders_rows,
+            flush_secs=self.args.journal_flush, fsync=self.args.journal_fsync)
+        # Every tick, bar, candle, order and fill, see journal.EventJournal. None if off.
+        # Candles, orders and fills go to events, ticks and bars to market_events,
+        # which only one app of the symbol gets, so they are journaled once. Kept
+        # by this app when __init__() is run again to reconnect, released by _disconnect()
+        self.events = open_events(self.args.event_dir, self.args.symbol) if self.args.event_dir else None
+        self.market_events = claim_events(self.args.event_dir, self.args.symbol, self) if self.args.event_dir else None
+        # Ticks and 5s bars archived for backtesting, by one app of the symbol. See journal.TickRecorder
+        self.recorder = claim_recorder(self.args.record_dir, self.args.symbol, self) if self.args.record_dir else None
 
         self.candle_calc_use_prev_ha = True
         self.RT_BAR_PERIOD = MarketDataApp.RT_BAR_PERIOD
@@ -99,22 +140,8 @@ class MarketDataApp(EClient, EWrapper):
         self.period = args.bar_period
         self.order_type = args.order_type
         self.order_size = args.order_size
-        df_cols = {
-            'time': [],
-            'open': [],
-            'high': [],
-            'low': [],
-            'close': [],
-            'ha_open': [],
-            'ha_close': [],
-            'ha_high': [],
-            'ha_low': [],
-            'ha_color': [],
-        }
-        self.candles = pd.DataFrame(df_cols)
-        self.cache = []
         self._tohlc = tuple() # Real-time 5s update data from IB
-        self.first_order = True # Set to False after first order
+        self.warm_up_bar_size = None # Historical bar size of a warm-up in progress
 
         #
         self.best_bid = None
@@ -126,7 +153,47 @@ class MarketDataApp(EClient, EWrapper):
         self.contract = self._create_contract_obj()
         self.contract_details = None
 
+        # Last candle_window candles in memory, older ones spilled to
+        # spill_dir/<symbol>_<period>s.candles
+        spill_dir = self.args.spill_dir or None
+        # Candle periods anchored at the session open (or midnight) in the exchange timezone
+        early_closes = {
+            dt.date.fromisoformat(day): close for (day, close) in (x.split('@') for x in self.args.early_close)}
+        self.calendar = TradingCalendar(self.args.exchange_tz, self.args.session, early_closes)
+        if self.args.bar_source != 'rtbars':
+            # Candles from ticks, closed by a timer at the period boundary
+            self.bar_engine = TickBarEngine(
+                self.RT_BAR_PERIOD, self.args.candle_window, spill_dir, self.args.symbol, self.calendar)
+        elif self.gateway is not None:
+            # One 5s bar subscription per contract, shared with the other periods
+            self.bar_engine = self.gateway.bar_engine(
+                self.contract, self.RT_BAR_PERIOD, self.RT_BAR_DATA_TYPE,
+                self.args.candle_window, spill_dir, self.calendar, self.market_events, self.recorder)
+        elif bar_engine is not None:
+            # The BarEngine of another app of the symbol, fed by its 5s bar
+            # subscription. This app only adds its period, see run_apps()
+            self.bar_engine = bar_engine
+        else:
+            self.bar_engine = BarEngine(
+                self.RT_BAR_PERIOD, self.args.candle_window, spill_dir, self.args.symbol, self.calendar)
+        self.bar_engine_shared = bar_engine is not None
+        self.candle_builder = self.bar_engine.add_period(
+            self.period, self._on_candle, self.candle_calc_use_prev_ha)
+        self.candles = self.candle_builder.candles
+
+        # All strategies run on the candles above, and trade through submit()
+        self.strategies = [
+            load_strategy(name)(self.args.symbol, self.period, self.order_size) for name in self.args.strategy]
+        for strategy in self.strategies:
+            strategy.attach(self)
+        self.orderId2strategy = {}
+
         #
+        if self.gateway is not None and not hasattr(self, 'mktData_reqId'):
+            # Shared connection. reqIds must be unique across all symbols
+            self.mktData_reqId = self.gateway.newReqId(self)
+            self.rtBars_reqId = self.gateway.newReqId(self)
+            self.historicalData_reqId = self.gateway.newReqId(self)
         if not hasattr(self, 'mktData_reqId'):
             # First time init of object
             self.mktData_reqId = random.randint(0, 999)
@@ -148,6 +215,8 @@ class MarketDataApp(EClient, EWrapper):
             self._connect()
             self._cancel_orders()
             self._subscribe_mktData()
+            if self.args.warm_up:
+                self._warm_up(self.args.warm_up)
             self._subscribe_rtBars()
         else:
             # Run test setup here
@@ -156,7 +225,10 @@ class MarketDataApp(EClient, EWrapper):
 
         if not hasattr(self, 'order_id'):
             # Allow for obj to re __init__() and not reset self.order_id
-            if self.start_order_id is not None:
+            if self.gateway is not None:
+                # Taken from the gateway order by order, see _update_order_id()
+                self.order_id = None
+            elif self.start_order_id is not None:
                 self.order_id = self.start_order_id
             else:
                 self._update_order_id()
@@ -165,22 +237,52 @@ class MarketDataApp(EClient, EWrapper):
             pass
             #self._update_order_id()
 
+    @staticmethod
+    def msg_interest(args):
+        # MSG_INTEREST, plus the tick sizes when recording
+        if args.record_dir:
+            return MarketDataApp.MSG_INTEREST + (IN.TICK_SIZE,)
+        return MarketDataApp.MSG_INTEREST
+
     def error(self, reqId, errorCode, errorString):
         self.logger.warning(f'{codes(errorCode)}, {errorCode}, {errorString}')
+        if reqId == self.historicalData_reqId and self.warm_up_bar_size is not None:
+            # No history. Release the held live bars and start cold
+            self.historicalDataBatch(reqId, {col: np.array([]) for col in ('date', 'open', 'high', 'low', 'close')})
 
     def tickPrice(self, reqId, tickType, price, attrib):
+        if self.recorder is not None and reqId == self.mktData_reqId:
+            self.recorder.tick(time.time(), tickType, price)
+        if self.market_events is not None and reqId == self.mktData_reqId and tickType in (1, 2, 4):
+            self.market_events.append(EventJournal.TICK, time.time(), tickType, close=price)
         if tickType == 1 and reqId == self.mktData_reqId:
             # Bid
             self.best_bid = price
-            self.logger.info(f'Bid update: {price}')
+            self.tick_logger.info('Bid update: %s', price)
         if tickType == 2 and reqId == self.mktData_reqId:
             # Ask
             self.best_ask = price
-            self.logger.info(f'Ask update: {price}')
+            self.tick_logger.info('Ask update: %s', price)
         if tickType == 4 and reqId == self.mktData_reqId:
             # Last
             self.last = price
-            self.logger.info(f'Last trade update: {price}')
+            self.tick_logger.info('Last trade update: %s', price)
+            for strategy in self.strategies:
+                strategy.on_tick(time.time(), price)
+        if reqId == self.mktData_reqId and (
+                (self.args.bar_source == 'last' and tickType == 4)
+                or (self.args.bar_source == 'mid' and tickType in (1, 2))):
+            self._on_tick()
+
+    def tickSize(self, reqId, tickType, size):
+        if self.recorder is not None and reqId == self.mktData_reqId:
+            self.recorder.tick(time.time(), tickType, size)
+
+    def tickByTickMidPoint(self, reqId, time, midPoint):
+        if self.market_events is not None and reqId == self.rtBars_reqId:
+            self.market_events.append(EventJournal.TICK, time, EventJournal.MIDPOINT, close=midPoint)
+        if reqId == self.rtBars_reqId and self.last and self.best_bid and self.best_ask:
+            self.bar_engine.tick(time, midPoint)
 
     def nextValidId(self, orderId: int):
         super().nextValidId(orderId)
@@ -218,6 +320,13 @@ class MarketDataApp(EClient, EWrapper):
             f'Order Executed: {reqId}, {contract.symbol},'
             f'{contract.secType}, {contract.currency}, {execution.execId},'
             f'{execution.orderId}, {execution.shares}, {execution.lastLiquidity}')
+        if self.events is not None:
+            self.events.append(
+                EventJournal.FILL, time.time(), 1 if execution.side == 'BOT' else -1,
+                execution.orderId, execution.shares, close=execution.price)
+        strategy = self.orderId2strategy.get(execution.orderId)
+        if strategy is not None:
+            strategy.on_fill(execution)
 
     def historicalData(self, reqId, bar):
         self.logger.info(
@@ -229,6 +338,16 @@ class MarketDataApp(EClient, EWrapper):
             f'Open: {bar.open}, High: {bar.high},'
             f'Low: {bar.low}, Close: {bar.close}')
 
+    def historicalDataBatch(self, reqId, arrays):
+        self.logger.info(f'HistoricalData: {reqId}, {self.args.symbol}, bars: {len(arrays["date"])}')
+        if reqId != self.historicalData_reqId or self.warm_up_bar_size is None:
+            return
+        bar_size, self.warm_up_bar_size = self.warm_up_bar_size, None
+        self.bar_engine.warm_up(
+            self.period, arrays['date'].astype(np.int64), arrays['open'],
+            arrays['high'], arrays['low'], arrays['close'], bar_size)
+        self.logger.warning(f'Warmed up - {self.args.symbol}, {self.period}, candles: {len(self.candles)}')
+
     def position(self, account:str, contract:Contract, position:float, avgCost:float):
         print(f'account: {account}, contract: {contract}, position: {position}, avgCost: {avgCost}')
         pass ### tmp
@@ -236,10 +355,13 @@ class MarketDataApp(EClient, EWrapper):
     def realtimeBar(self, reqId, time, open_, high, low, close, volume, wap, count):
         super().realtimeBar(reqId, time, open_, high, low, close, volume, wap, count)
         self._tohlc = (time, open_, high, low, close)
-        self.logger.warning(
-            f'RealTimeBar. TickerId: {reqId}, {self.args.symbol}, '
-            f'{dt.datetime.fromtimestamp(time)}, OHLC: '
-            f'{self._tohlc[1:]}, {volume}, {wap}, {count}')
+        if self.market_events is not None:
+            self.market_events.append(EventJournal.BAR, time, size=volume, open=open_, high=high, low=low, close=close)
+        if self.recorder is not None:
+            self.recorder.bar(time, open_, high, low, close, volume, wap, count)
+        self.tick_logger.warning(
+            'RealTimeBar. TickerId: %s, %s, %s, OHLC: %s, %s, %s, %s',
+            reqId, self.args.symbol, LocalTime(time), self._tohlc[1:], volume, wap, count)
         #
         if self.last and self.best_bid and self.best_ask:
             # Don't start processing data until we get the first msgs from data feed
@@ -260,6 +382,10 @@ class MarketDataApp(EClient, EWrapper):
             self.reqOpenOrders() # openOrder() will receive all open orders and do cancelOrder() there
 
     def _connect(self):
+        if self.gateway is not None:
+            self.gateway.attach(self)
+            self.logger.info(f'Attached to gateway - {self.args.symbol}, {self.gateway.client_id}')
+            return
         self.logger.info(f'port: {self.args.port}, client_id {self.client_id}')
         self.connect("127.0.0.1", self.args.port, self.client_id)
         while not self.isConnected():
@@ -268,6 +394,22 @@ class MarketDataApp(EClient, EWrapper):
         self.logger.info(f'Connected - {self.args.symbol}, {self.client_id}')
 
     def _disconnect(self):
+        self.candles.flush()
+        flush_journals()
+        release_claims(self)
+        if self.args.bar_source != 'rtbars':
+            self.bar_engine.stop()
+            if self.args.bar_source == 'tbt':
+                self.cancelTickByTickData(self.rtBars_reqId)
+        if self.gateway is not None:
+            # Leave the shared connection up for the other symbols
+            self.cancelMktData(self.mktData_reqId)
+            self.bar_engine.remove_listener(self.period, self._on_candle)
+            self.gateway.detach(self)
+            self.logger.info(f'Detached from gateway - {self.args.symbol}')
+            return
+        if self.bar_engine_shared:
+            self.bar_engine.remove_listener(self.period, self._on_candle)
         self.disconnect()
         while self.isConnected():
             self.logger.info(f'Disconnecting from IB.. {self.args.symbol}, {self.client_id}')
@@ -278,12 +420,27 @@ class MarketDataApp(EClient, EWrapper):
         self.reqMktData(self.mktData_reqId, self.contract, '', False, False, [])
 
     def _subscribe_rtBars(self):
+        if self.args.bar_source != 'rtbars':
+            self._subscribe_ticks()
+            return
+        if self.gateway is not None:
+            # Done once per contract by the gateway, see SharedGateway.bar_engine()
+            return
+        if self.bar_engine_shared:
+            # Done by the app the bar engine is from
+            return
         self.reqRealTimeBars(
             self.rtBars_reqId,
             self.contract,
             self.RT_BAR_PERIOD,
             self.RT_BAR_DATA_TYPE, False, [])
 
+    def _subscribe_ticks(self):
+        # last/mid ticks come with the mktData subscription
+        if self.args.bar_source == 'tbt':
+            self.reqTickByTickData(self.rtBars_reqId, self.contract, 'MidPoint', 0, False)
+        self.bar_engine.start()
+
     def _get_historical_data(self):
         self.reqHistoricalData(
             self.historicalData_reqId,
@@ -297,138 +454,77 @@ class MarketDataApp(EClient, EWrapper):
             True,
             [])
 
+    def _warm_up(self, n_candles):
+        # Seed self.candles with HA candles from history, so the HA open has
+        # converged by the first live candle. Live bars are held until then
+        bar_size, bar_size_str = next(
+            (secs, name) for (secs, name) in MarketDataApp.HISTORICAL_BAR_SIZES if self.period % secs == 0)
+        # Whole days, plus a weekend worth of margin for the closed hours
+        duration_days = math.ceil(n_candles * self.period / 86400) + 3
+        self.bar_engine.hold(self.period)
+        self.warm_up_bar_size = bar_size
+        self.logger.info(f'Warming up - {self.args.symbol}, {duration_days} D of {bar_size_str} bars')
+        self.reqHistoricalData(
+            self.historicalData_reqId,
+            self.contract,
+            '',
+            f'{duration_days} D',
+            bar_size_str,
+            self.RT_BAR_DATA_TYPE,
+            0,
+            2, # Epoch seconds, as with the real-time bars
+            False,
+            [])
+
     def _get_positions(self): ### tmp
         self.reqPositions()
 
     def _on_update(self):
         # Process 5s updates as received
-        self._cache_update(self._tohlc)
-        if self._check_period():
-            # On HA candle tick point
-            self._update_candles()
-            self.cache = []
-            if self.candles.shape[0] > 0:
-                #
-                self._check_order_conditions()
-
-    def _check_period(self):
-        # Return True if period ends at this update, else False
-        _time = dt.datetime.fromtimestamp(self._tohlc[0])
-        # Add bar period below becoz ts received from IB represents beginning of bar
-        total_secs = _time.hour*3600 + _time.minute*60 + _time.second + self.RT_BAR_PERIOD
-        if total_secs % self.period == 0:
-            return True
-        return False
+        self.bar_engine.update(*self._tohlc)
 
-    def _write_csv_row(self, row, filename, newfile=False):
-        if newfile:
-            mode = 'w'
-        else:
-            mode = 'a'
-        with open(filename, mode) as csvfile:
-            csvwriter = csv.writer(csvfile)
-            csvwriter.writerows(row)
-
-    def _update_candles(self):
-        # Bar completed
-        if self.cache[-1][0] + self.RT_BAR_PERIOD - self.cache[0][0] == self.period:
-            # Hit the candle period boundary. Update HA candles dataframe
-            _pd = self._calc_new_candle()
-            self.candles = self.candles.append(_pd, ignore_index=True)
-            #
-            bar_color = None
-#            bar_color_prev = None
-#            if self.candles.shape[0] > 1:
-            if isinstance(self.candles['ha_color'].values[-1], str):
-                # Check it is not an indecision candle
-                bar_color = self.candles['ha_color'].values[-1].upper()
-#            else:
-#                # First HA candle not yet available
-#                return
-#            if self.candles.shape[0] > 2:
-#                if isinstance(self.candles['ha_color'].values[-2], str):
-#                    # Check it is not an indecision candle
-#                    bar_color_prev = self.candles['ha_color'].values[-2].upper()
-            self.logger.warning(f'Candle: {self.cache[-1][0]}, {self.args.symbol} - {bar_color}')
-            csv_row = [col[1] for col in _pd.items()]
-            csv_row.insert(1, self.args.symbol)
-            self._write_csv_row((csv_row,), self.logfile_candles)
-        elif self.cache[-1][0] + self.RT_BAR_PERIOD - self.cache[0][0] < self.period:
-            # First iteration. Not enough updates for a full period
-            self.logger.info('Not enough data for a candle')
-        else:
-            raise ValueError
-
-    def _calc_new_candle(self):
-        ohlc = (
-            self.cache[0][1],
-            max([u[2] for u in self.cache]),
-            min([u[3] for u in self.cache]),
-            self.cache[-1][4]
-        )
-        ha_c = (ohlc[0] + ohlc[1] + ohlc[2] + ohlc[3])/4
-        if self.candle_calc_use_prev_ha:
-            if self.candles.shape[0] == 0:
-                # No prior HA candle is available, use prev raw candle open/close
-                #ha_o = (self.candles['open'].values[-1] + self.candles['close'].values[-1])/2
-                ha_o = (ohlc[0] + ohlc[3])/2
-                ha_h = ohlc[1]
-                ha_l = ohlc[2]
-            else:
-                ha_o = (self.candles['ha_open'].values[-1] + self.candles['ha_close'].values[-1])/2
-                ha_h = max(ohlc[1], ha_o, ha_c)
-                ha_l = min(ohlc[2], ha_o, ha_c)
-        else:
-            ha_o = (self.candles['open'].values[-1] + self.candles['close'].values[-1])/2
-            ha_h = max(ohlc[1], ha_o, ha_c)
-            ha_l = min(ohlc[2], ha_o, ha_c)
-        if ha_c > ha_o:
-            ha_color = 'Green'
-        elif ha_c < ha_o:
-            ha_color = 'Red'
-        else:
-            # Indecision candle
-            ha_color = None
-        ha_ochl = (ha_o, ha_c, ha_h, ha_l, ha_color)
-        _pd = {
-            'time': self._tohlc[0] ,
-            'open': ohlc[0],
-            'high': ohlc[1],
-            'low': ohlc[2],
-            'close': ohlc[3],
-            'ha_open': ha_ochl[0],
-            'ha_close': ha_ochl[1],
-            'ha_high': ha_ochl[2],
-            'ha_low': ha_ochl[3],
-            'ha_color': ha_ochl[4],
-        }
-        return _pd
-
-    def _cache_update(self, tohlc):
-        # Still in the middle of a period. Cache data for processing at end of period
-        self.cache.append(tohlc)
-
-    def _check_order_conditions(self):
-        if not isinstance(self.candles['ha_color'].values[-1], str):
-            # Skip if first HA candle not yet available, or this is an indecision candle
+    def _on_tick(self):
+        # Bar source last/mid: feed the tick candles with each price update
+        if not (self.last and self.best_bid and self.best_ask):
             return
-        #
-        _side = 'Buy'
-        if self.candles['ha_color'].values[-1] == 'Red':
-            _side = 'Sell'
-        #
-        if self.first_order:
-            order_obj = self._place_order(_side)
-            self.first_order = False
-            self.order_size *= 2
-        elif not self.candles['ha_color'].values[-1] == self.candles['ha_color'].values[-2]:
-            order_obj = self._place_order(_side)
+        if self.args.bar_source == 'last':
+            price = self.last
         else:
-            # Candle color same as previous. Do not place an order
+            price = (self.best_bid + self.best_ask)/2
+        self.bar_engine.tick(time.time(), price)
+
+    def _on_candle(self, period, candle):
+        # New HA candle for self.period, from self.bar_engine
+        if not (self.last and self.best_bid and self.best_ask):
+            # Shared engine. Its feed may start before ours
             return
+        bar_color = None
+        if candle['ha_color'] is not None:
+            # Check it is not an indecision candle
+            bar_color = candle['ha_color'].upper()
+        self.logger.warning(f'Candle: {candle["time"]}, {self.args.symbol} - {bar_color}')
+        csv_row = [col[1] for col in candle.items()]
+        csv_row.insert(1, self.args.symbol)
+        self.candles_journal.write((csv_row,))
+        if self.events is not None:
+            self.events.append(
+                EventJournal.CANDLE, candle['time'], CandleStore.COLORS[candle['ha_color']], period,
+                open=candle['open'], high=candle['high'], low=candle['low'], close=candle['close'])
+        for strategy in self.strategies:
+            strategy.on_bar(self.candles)
+
+    def submit(self, strategy, side, size):
+        # Place an order for strategy. See strategy.Strategy
+        order_obj = self._place_order(side, size=size)
+        self.orderId2strategy[order_obj.order_id] = strategy
         pr = order_obj.lmtPrice if order_obj.orderType == 'LMT' else None
-        csv_row = (order_obj.timestamp, order_obj.order_id, self.args.symbol, _side, order_obj.orderType, order_obj.totalQuantity, pr)
-        self._write_csv_row((csv_row,), self.logfile_orders)
+        csv_row = (order_obj.timestamp, order_obj.order_id, self.args.symbol, side, order_obj.orderType, order_obj.totalQuantity, pr)
+        self.orders_journal.write((csv_row,))
+        if self.events is not None:
+            self.events.append(
+                EventJournal.ORDER, order_obj.timestamp, 1 if side == 'Buy' else -1, order_obj.order_id,
+                order_obj.totalQuantity, close=pr if pr is not None else np.nan)
+        return order_obj
 
     def _test_setup(self):
         # Sandbox to set up test env
@@ -462,9 +558,9 @@ class MarketDataApp(EClient, EWrapper):
 #        if err_check == 49:
 #            raise Exception('error getting contract details')
 
-    def _place_order(self, side, order_obj=None):
+    def _place_order(self, side, order_obj=None, size=None):
         if not order_obj:
-            order_obj = self._create_order_obj(side)
+            order_obj = self._create_order_obj(side, size)
         self.logger.warning(f'Order: {order_obj.order_id}, {self.contract.symbol}, {order_obj.action}, {order_obj.orderType}, {order_obj.totalQuantity}, {order_obj.lmtPrice}')
         self.placeOrder(order_obj.order_id, self.contract, order_obj)
         return order_obj
@@ -472,7 +568,10 @@ class MarketDataApp(EClient, EWrapper):
     def _update_order_id(self):
         # The proper way to do this is call self.reqIds(), but have seen issues here
         # Use manual option for now
-        if self.start_order_id is not None:
+        if self.gateway is not None:
+            # One increasing sequence for all apps on the shared clientId
+            self.order_id = self.gateway.newOrderId(self)
+        elif self.start_order_id is not None:
             self.order_id += 1
         else:
             #
@@ -494,10 +593,10 @@ class MarketDataApp(EClient, EWrapper):
             # Regular trading hours
             return False
 
-    def _create_order_obj(self, side):
+    def _create_order_obj(self, side, size=None):
         order = Order()
         order.action = side.upper()
-        order.totalQuantity = self.order_size
+        order.totalQuantity = self.order_size if size is None else size
         if self._check_ORH():
             # Note here: self.order_type can deviate from self.args.order_type
             order.orderType = self.order_type = 'LMT'
@@ -526,32 +625,291 @@ class MarketDataApp(EClient, EWrapper):
         contract.currency = self.args.currency
         return contract
 
+class AsyncMarketDataApp(AsyncEClient, MarketDataApp):
+    """
+        MarketDataApp on the asyncio client: no reader thread, and all
+        instances created from the same thread share its event loop
+    """
+
+
+async def _run_async(app):
+    # runAsync() of one app on the shared loop. A failure is logged and only
+    # ends that app, as a failing thread does without --asyncio
+    try:
+        await app.runAsync()
+    except Exception:
+        app.logger.exception(f'App failed - {app.args.symbol}, {app.period}')
+
+
+def run_apps(args, instrs, client_ids, order_slots, stop=None, status=None, worker=None):
+    """
+        Run one app per (symbol, period) of instrs, until their connections close
+
+        Each app has its own connection, unless args.shared_connection. Either
+        way there is one 5s bar subscription and BarEngine per symbol, for all
+        its bar periods: with their own connections, the symbol's first app
+        subscribes, and the others build their candles from its bars.
+
+        Arguments
+        ---------
+        instrs (list):      (symbol, bar period) pairs
+        client_ids (list):  clientId of each app, the first one also being
+            the shared connection's
+        order_slots (list): app i places orders from 1000*order_slots[i]. Unused
+            with args.shared_connection, the gateway hands out the order IDs
+        stop (Event):       optional. Once set, all apps disconnect and this returns
+        status (Queue):     optional. Gets ('status', worker, [app status..])
+            every args.status_secs, see _app_status()
+        worker (int):       worker number, for the status msgs
+    """
+    apps = []
+    gateway = None
+    loop = None
+    if args.shared_connection:
+        # One connection and one reader/run thread for all symbols,
+        # and one 5s bar subscription per symbol for all its bar periods
+        gateway = SharedGateway(args.port, client_id=client_ids[0], msg_interest=MarketDataApp.msg_interest(args))
+        for (symbol, period) in instrs:
+            _args = copy.deepcopy(args)
+            _args.symbol = symbol
+            _args.bar_period = period
+            apps.append(MarketDataApp(None, _args, gateway=gateway))
+    else:
+        app_cls = AsyncMarketDataApp if args.asyncio else MarketDataApp
+        engines = {} # symbol -> BarEngine of its first app, for the other periods
+        for i, instr, client_id in zip(order_slots, instrs, client_ids):
+            _args = copy.deepcopy(args)
+            _args.symbol, _args.bar_period = instr
+            app = app_cls(client_id, _args, start_order_id=1000*i, bar_engine=engines.get(_args.symbol))
+            if args.bar_source == 'rtbars':
+                engines.setdefault(_args.symbol, app.bar_engine)
+            apps.append(app)
+        if args.asyncio:
+            loop = asyncio.get_event_loop()
+    if stop is not None:
+        threading.Thread(
+            target=_watch_apps, args=(args, apps, gateway, loop, stop, status, worker), daemon=True).start()
+    if gateway is not None:
+        gateway._run()
+    elif args.asyncio:
+        # All symbols run on this thread's event loop
+        loop.run_until_complete(asyncio.gather(*(_run_async(o) for o in apps)))
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(apps)) as executor:
+            for app in apps:
+                executor.submit(app._run)
+
+
+def _app_status(app):
+    return {
+        'symbol': app.args.symbol, 'period': app.period, 'connected': app.isConnected(),
+        'candles': app.candles.count, 'orders': len(app.orderId2strategy), 'last': app.last}
+
+
+def _watch_apps(args, apps, gateway, loop, stop, status, worker):
+    # Report the apps' status until stop is set, then disconnect them
+    def report():
+        if status is not None:
+            status.put(('status', worker, [_app_status(app) for app in apps]))
+    while not stop.wait(args.status_secs):
+        report()
+    if loop is not None:
+        # On the event loop's thread
+        for app in apps:
+            loop.call_soon_threadsafe(app._disconnect)
+        loop.call_soon_threadsafe(report)
+        return
+    for app in apps:
+        app._disconnect()
+    if gateway is not None:
+        gateway.disconnect()
+    report()
+
+
+def _worker_path(path, worker):
+    # path of a worker's own file: logs/log_orders.csv -> logs/log_orders.w<n>.csv
+    (root, ext) = os.path.splitext(path)
+    return f'{root}.w{worker}{ext}'
+
+
+def _run_worker(worker, args, instrs, client_ids, order_slots, stop, status):
+    # Worker process of supervise(). Ctrl-C and SIGTERM, which may be sent to
+    # the whole process group, are for the supervisor to handle
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    setup_app_logging(args, f'logs/IB_trader.w{worker}.log')
+    # Own CSV journals too, one writer per file
+    args.candles_csv = _worker_path(args.candles_csv, worker)
+    args.orders_csv = _worker_path(args.orders_csv, worker)
+    status.put(('started', worker, [symbol for symbol, _ in instrs]))
+    try:
+        run_apps(args, instrs, client_ids, order_slots, stop, status, worker)
+    except Exception as e:
+        logging.getLogger(__name__).exception(f'Worker {worker} failed')
+        status.put(('failed', worker, repr(e)))
+        raise
+    status.put(('stopped', worker, None))
+    # The journals and the log queue are closed at exit, as spawned workers
+    # exit through sys.exit()
+
+
+def _shard(instrs, n):
+    # Indexes of instrs of each of n workers. All bar periods of a symbol
+    # go to the same worker, symbols round robin
+    symbols = list(dict.fromkeys(symbol for symbol, _ in instrs))
+    shards = [[] for _ in range(min(n, len(symbols)))]
+    for i, (symbol, _) in enumerate(instrs):
+        shards[symbols.index(symbol) % len(shards)].append(i)
+    return shards
+
+
+def supervise(args, instrs, client_ids):
+    """
+        Run the apps in args.workers processes, each with its own
+        connection(s) and GIL, and its own log file, logs/IB_trader.w<n>.log,
+        and CSV journals, logs/log_candles.w<n>.csv and logs/log_orders.w<n>.csv
+
+        Symbols are spread round robin over the workers, a symbol's bar
+        periods staying together. Each app keeps its clientId and order ID
+        range from the single process layout. The worker status is logged
+        every args.status_secs. Ctrl-C or SIGTERM stops all workers: they
+        disconnect their apps, flush the candles and journals, and exit.
+        A worker failing stops the others too, rather than leaving part of
+        the symbols trading. Workers still up args.status_secs after the
+        stop are killed.
+    """
+    logger = logging.getLogger(__name__)
+    ctx = multiprocessing.get_context('spawn')
+    stop = ctx.Event()
+    status = ctx.Queue()
+    workers = {}
+    for worker, shard in enumerate(_shard(instrs, args.workers)):
+        workers[worker] = ctx.Process(
+            target=_run_worker, name=f'IB_trader-w{worker}',
+            args=(worker, args, [instrs[i] for i in shard], [client_ids[i] for i in shard], shard, stop, status))
+        workers[worker].start()
+
+    signaled = []
+    def _on_signal(signum, frame):
+        # Only flag it. Setting the Event could deadlock on its lock
+        signaled.append(signum)
+    signal.signal(signal.SIGINT, _on_signal)
+    signal.signal(signal.SIGTERM, _on_signal)
+
+    statuses = {}
+    next_report = time.monotonic() + args.status_secs
+    stop_deadline = None
+    killed = False
+    while any(w.is_alive() for w in workers.values()):
+        if killed:
+            # A killed worker may have left half a msg in the status queue
+            time.sleep(0.5)
+            continue
+        try:
+            (kind, worker, info) = status.get(timeout=0.5)
+        except queue.Empty:
+            pass
+        else:
+            if kind == 'status':
+                statuses[worker] = info
+            elif kind == 'started':
+                logger.warning(f'Worker {worker} started - pid: {workers[worker].pid}, symbols: {info}')
+            elif kind == 'stopped':
+                logger.warning(f'Worker {worker} stopped')
+            elif kind == 'failed':
+                logger.error(f'Worker {worker} failed - {info}')
+        failed = [w for w, p in workers.items() if p.exitcode not in (None, 0)]
+        if stop_deadline is None and (signaled or failed):
+            logger.warning(f'Stopping workers - signal: {signaled}, failed: {failed}')
+            stop.set()
+            stop_deadline = time.monotonic() + args.status_secs
+        if stop_deadline is not None and time.monotonic() > stop_deadline:
+            for w, p in workers.items():
+                if p.is_alive():
+                    logger.error(f'Worker {w} did not stop. Killing it')
+                    p.kill()
+            killed = True
+        if time.monotonic() >= next_report:
+            next_report += args.status_secs
+            _report(logger, workers, statuses)
+    for p in workers.values():
+        p.join()
+    _report(logger, workers, statuses)
+
+
+def _report(logger, workers, statuses):
+    alive = sum(p.is_alive() for p in workers.values())
+    apps = [s for info in statuses.values() for s in info]
+    summary = ', '.join(
+        f'{s["symbol"]} {s["period"]}s: {"up" if s["connected"] else "down"}, '
+        f'candles {s["candles"]}, orders {s["orders"]}' for s in apps)
+    logger.warning(f'Workers up: {alive}/{len(workers)} - {summary}')
+    print(f'Workers up: {alive}/{len(workers)} - {summary}')
+
+
 def main_cli(args):
     # For running the app from the command line
 
+    # One app per symbol and bar period
+    instrs = [(symbol, period) for symbol in args.symbol for period in args.bar_period]
     while True:
-        clientIds = list({random.randint(0, 999) for _ in args.symbol})
-        if len(clientIds) == len(args.symbol):
+        clientIds = list({random.randint(0, 999) for _ in instrs})
+        if len(clientIds) == len(instrs):
             break
-    objs = {}
-    for i, instr in enumerate(args.symbol):
-        _args = copy.deepcopy(args)
-        _args.symbol = instr
-        objs[instr] = MarketDataApp(clientIds[i], _args, start_order_id=1000*i)
-    with concurrent.futures.ThreadPoolExecutor(max_workers=len(args.symbol)) as executor:
-        futures = []
-        for instr in args.symbol:
-            futures.append(executor.submit(objs[instr]._run))
-
-def parse_args():
+    if args.workers > 1:
+        supervise(args, instrs, clientIds)
+        return
+    run_apps(args, instrs, clientIds, range(len(instrs)))
+
+
+def setup_app_logging(args, logfile='logs/IB_trader.log'):
+    # Logging and ibapi tracing as per args. Returns the log QueueListener
+    listener = None
+    os.makedirs(os.path.dirname(logfile), exist_ok=True)
+    if args.loglevel == 'debug':
+        listener = setup_logging(filename=logfile, level=logging.DEBUG, tick_rate=args.log_tick_rate)
+    elif args.loglevel == 'info':
+        listener = setup_logging(filename=logfile, level=logging.INFO, tick_rate=args.log_tick_rate)
+    elif args.loglevel == 'warning':
+        listener = setup_logging(filename=logfile, level=logging.WARNING, tick_rate=args.log_tick_rate)
+    if args.loglevel != 'debug':
+        # ibapi's per msg debug logging would be filtered out anyway
+        setHotPathLogging(False)
+    setWireTrace(args.wire_trace)
+    return listener
+
+def _bar_periods(value):
+    # -b value: one or more comma separated bar periods
+    return [int(period) for period in value.split(',')]
+
+
+def _arg_parser():
     argp = argparse.ArgumentParser()
-    argp.add_argument("symbol", type=str, default=None, nargs='+')
+    argp.add_argument("symbol", type=str, nargs='*')
     argp.add_argument(
         "-l", "--loglevel", type=str, default='warning', help="Logging options: debug/info/warning"
     )
+    argp.add_argument(
+        "--log-tick-rate", type=int, default=10, help="Max per tick/bar log msgs per sec, per msg and symbol (0: no limit)"
+    )
+    argp.add_argument(
+        "--wire-trace", type=int, default=0, help="Log 1 in N raw msgs received from IB (0: off)"
+    )
     argp.add_argument(
         "-d", "--debug", action='store_const', const=True, default=False, help="Run in debug mode. MarketDataApp will init but not start feeds. And open up a debugger"
     )
+    argp.add_argument(
+        "--asyncio", action='store_const', const=True, default=False, help="Run all symbols on one asyncio event loop, without reader threads"
+    )
+    argp.add_argument(
+        "--workers", type=int, default=1, help="Worker processes to spread the symbols across, each with its own connection(s). 1: all in this process"
+    )
+    argp.add_argument(
+        "--status-secs", type=float, default=30.0, help="Secs between worker status reports, with --workers"
+    )
+    argp.add_argument(
+        "--shared-connection", action='store_const', const=True, default=False, help="Multiplex all symbols over one IB connection"
+    )
     argp.add_argument(
         "-p", "--port", type=int, default=4002, help="local port for connection: 7496/7497 for TWS prod/paper, 4001/4002 for Gateway prod/paper"
     )
@@ -565,7 +923,51 @@ def parse_args():
         "-t", "--security-type", type=str, default="STK", help="security type for symbols"
     )
     argp.add_argument(
-        "-b", "--bar-period", type=int, default=60, help="bar time period"
+        "-b", "--bar-period", type=_bar_periods, action='append', default=None,
+        help="bar time period(s), e.g. -b 60, -b 60,300 or -b 60 -b 300 (default 60). Each symbol is traded on every period given"
+    )
+    argp.add_argument(
+        "--bar-source", type=str, default='rtbars', choices=('rtbars', 'last', 'mid', 'tbt'),
+        help="Candles from: 5s real-time bars/last or mid price ticks/tick-by-tick midpoints. Tick candles close on a timer at the period boundary"
+    )
+    argp.add_argument(
+        "--strategy", type=str, default=['ha'], nargs='+', help="Strategies run on each symbol's candles: ha, or module:Class of a strategy.Strategy subclass"
+    )
+    argp.add_argument(
+        "--exchange-tz", type=str, default=None, help="Exchange timezone the candle periods are aligned in, e.g. US/Eastern (default: local time)"
+    )
+    argp.add_argument(
+        "--session", type=str, default=None, nargs=2, metavar=('OPEN', 'CLOSE'), help="Session open and close, HH:MM in the exchange timezone. Candle periods start at the open and end at the close"
+    )
+    argp.add_argument(
+        "--early-close", type=str, default=[], nargs='+', help="Early close days, as YYYY-MM-DD@HH:MM"
+    )
+    argp.add_argument(
+        "--candle-window", type=int, default=10000, help="Candles kept in memory per symbol and period"
+    )
+    argp.add_argument(
+        "--spill-dir", type=str, default='logs/candles', help="Directory of the candle history files, for candles leaving the window ('': no history)"
+    )
+    argp.add_argument(
+        "--journal-flush", type=float, default=1.0, help="Max secs a candle/order row waits before being written to logs/*.csv"
+    )
+    argp.add_argument(
+        "--journal-fsync", action='store_const', const=True, default=False, help="fsync logs/*.csv on each write"
+    )
+    argp.add_argument(
+        "--event-dir", type=str, default='logs/events', help="Directory of the binary event journals, one set of files per symbol and day ('': off)"
+    )
+    argp.add_argument(
+        "--candles-csv", type=str, default='logs/log_candles.csv', help="CSV journal of the candles (with --workers, one per worker: <name>.w<n>.csv)"
+    )
+    argp.add_argument(
+        "--orders-csv", type=str, default='logs/log_orders.csv', help="CSV journal of the orders (with --workers, one per worker: <name>.w<n>.csv)"
+    )
+    argp.add_argument(
+        "--record-dir", type=str, default='', help="Directory to archive the ticks and 5s bars to, for backtesting, one set of files per symbol and day ('': off)"
+    )
+    argp.add_argument(
+        "-W", "--warm-up", type=int, default=0, help="Number of HA candles to seed from historical data at startup (0: off)"
     )
     argp.add_argument(
         "-s", "--order-size", type=int, default=100, help="Order size"
@@ -576,18 +978,28 @@ def parse_args():
     argp.add_argument(
         "-q", "--quote-type", type=str, default='last', help="Quote type (mid/last). Only used with LMT order type"
     )
+    return argp
+
 
-    args = argp.parse_args()
+def _finish_args(args):
+    args.bar_period = [period for periods in args.bar_period or [[60]] for period in periods]
     return args
 
+
+def parse_args(argv=None):
+    argp = _arg_parser()
+    args = argp.parse_args(argv)
+    if not args.symbol:
+        argp.error('the following arguments are required: symbol')
+    return _finish_args(args)
+
+
+def default_args():
+    # The args of an empty command line, i.e. the defaults, with no symbol.
+    # For apps started from code, which set the symbol and the args they choose
+    return _finish_args(_arg_parser().parse_args([]))
+
 if __name__ == "__main__":
     args = parse_args()
-
-    logfile = 'logs/IB_trader.log'
-    if args.loglevel == 'debug':
-        logging.basicConfig(filename=logfile, level=logging.DEBUG)
-    elif args.loglevel == 'info':
-        logging.basicConfig(filename=logfile, level=logging.INFO)
-    elif args.loglevel == 'warning':
-        logging.basicConfig(filename=logfile, level=logging.WARNING)
+    setup_app_logging(args)
     main_cli(args)
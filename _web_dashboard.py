@@ -13,7 +13,9 @@ import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output, State
 
-from IB_trader import MarketDataApp
+from IB_trader import (MarketDataApp, default_args)
+from ibapi.utils import setHotPathLogging
+from logqueue import setup_logging
 
 MAX_INSTRUMENTS = 100
 
@@ -32,12 +34,13 @@ def main():
 
     logfile = 'logs/IB_trader.log'
     if args.loglevel == 'info':
-        logging.basicConfig(filename=logfile, level=logging.INFO)
+        setup_logging(filename=logfile, level=logging.INFO)
     elif args.loglevel == 'warning':
-        logging.basicConfig(filename=logfile, level=logging.WARNING)
+        setup_logging(filename=logfile, level=logging.WARNING)
         #logging.basicConfig(level=logging.WARNING)
     else:
         raise ValueError
+    setHotPathLogging(False)
 
     trader_action = TraderAction(args.loglevel)
 
@@ -161,9 +164,6 @@ def main():
 
     app.run_server(debug=False)
 
-class Object(object):
-    pass
-
 class ApplicationLogicError(Exception):
     pass
 
@@ -243,13 +243,10 @@ class TraderAction:
 
 
     def _make_args(self, instrument):
-        args = Object()
-        args.currency = 'USD'
+        # The IB_trader defaults, but for the args set here
+        args = default_args()
         args.loglevel = 'info'
-        args.debug = False
-        args.exchange = 'SMART'
         args.port = self.port
-        args.security_type = 'STK'
         args.symbol = instrument
         args.order_size = self.state[instrument]['args'][0]
         args.bar_period = int(self.state[instrument]['args'][1]*60)
@@ -0,0 +1,231 @@
+#!/usr/local/bin/python3
+
+import argparse
+import datetime as dt
+import time as _time
+import numpy as np
+import pandas as pd
+
+from candles import (aggregate_periods, ha_series, CandleStore, PeriodSchedule, TradingCalendar)
+
+
+def load_bars(path):
+    """
+        Bars from a CSV or Parquet file, as numpy column arrays
+
+        The file needs open/high/low/close columns and a time column (time,
+        date or timestamp), holding the bar start as epoch seconds or as
+        datetimes. Naive datetimes are taken as local time, like the epoch
+        times IB sends are read by the live app.
+
+        Returns dict of arrays: time (int64 epoch seconds), open, high, low, close
+    """
+    if path.endswith(('.parquet', '.pq')):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path)
+    df.columns = [col.lower() for col in df.columns]
+    time_col = next(col for col in ('time', 'date', 'timestamp') if col in df.columns)
+    times = df[time_col]
+    if pd.api.types.is_numeric_dtype(times):
+        epoch = times.to_numpy(dtype=np.int64)
+    else:
+        times = pd.to_datetime(times)
+        if times.dt.tz is None:
+            # As UTC first, then shifted by the local UTC offset of each hour
+            epoch = times.to_numpy(dtype='datetime64[s]').astype(np.int64)
+            (hours, inverse) = np.unique(epoch // 3600, return_inverse=True)
+            utc_offset = np.array([_time.localtime(h*3600).tm_gmtoff for h in hours.tolist()], dtype=np.int64)
+            epoch = epoch - utc_offset[inverse]
+        else:
+            epoch = times.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy(dtype='datetime64[s]').astype(np.int64)
+    order = np.argsort(epoch, kind='stable')
+    bars = {'time': epoch[order]}
+    for col in ('open', 'high', 'low', 'close'):
+        bars[col] = df[col].to_numpy(dtype=np.float64)[order]
+    return bars
+
+
+def bar_size_of(time):
+    # Smallest step between bars, taken as the bar size
+    steps = np.diff(time)
+    steps = steps[steps > 0]
+    if not len(steps):
+        raise ValueError('Need at least 2 bars to infer the bar size')
+    return int(steps.min())
+
+
+def trading_calendar(exchange_tz=None, session=None, early_close=()):
+    # TradingCalendar of the --exchange-tz/--session/--early-close values, as the live app builds it
+    early_closes = {dt.date.fromisoformat(day): close for (day, close) in (x.split('@') for x in early_close)}
+    return TradingCalendar(exchange_tz, session, early_closes)
+
+
+def signals(colors, order_size):
+    """
+        Orders placed by strategy.HAStrategy.on_bar(), vectorized
+
+        An order goes out on every candle with a color (not indecision) that
+        differs from the previous candle's, the first one included. Buy on
+        Green, Sell on Red. The first order is order_size, later ones twice
+        that, to reverse the position.
+
+        Returns signed order quantities, one per candle
+    """
+    colors = np.asarray(colors, dtype=np.int64)
+    prev_colors = np.r_[0, colors[:-1]]
+    placed = (colors != 0) & (colors != prev_colors)
+    size = np.full(len(colors), 2*order_size, dtype=np.int64)
+    if placed.any():
+        size[np.argmax(placed)] = order_size
+    return np.where(placed, colors*size, 0)
+
+
+def ha_candles(bars, period, bar_size=None, use_prev_ha=True, calendar=None):
+    """
+        HA candles of one bar period, as the live app would build them, with
+        periods anchored by calendar (a TradingCalendar, local midnight if None)
+
+        Returns (time, open, close, ha_color) arrays, ha_color as
+        CandleStore.COLORS codes
+    """
+    if bar_size is None:
+        bar_size = bar_size_of(bars['time'])
+    if period % bar_size:
+        raise ValueError(f'Bar period {period} is not a multiple of the bar size {bar_size}')
+    (time, open, high, low, close) = aggregate_periods(
+        bars['time'], bars['open'], bars['high'], bars['low'], bars['close'], bar_size, period,
+        schedule=PeriodSchedule(period, calendar))
+    if len(time):
+        *_, colors = ha_series(open, high, low, close, use_prev_ha=use_prev_ha)
+    else:
+        colors = np.array([], dtype=np.int8)
+    return time, open, close, colors
+
+
+def evaluate(time, open, close, colors, period, order_size=100, fill='close', commission=0.0):
+    """
+        Trades and PnL of the HA strategy on candles from ha_candles()
+
+        Returns (fills, summary), see run()
+    """
+    qty = signals(colors, order_size)
+
+    if fill == 'next':
+        # Market order filled at the start of the next candle. None for the last one
+        price = np.r_[open[1:], np.nan]
+        qty = np.where(np.isnan(price), 0, qty)
+        price = np.nan_to_num(price)
+    elif fill == 'close':
+        price = close
+    else:
+        raise ValueError(f'Unknown fill: {fill}')
+
+    traded = np.abs(qty)*price
+    position = np.cumsum(qty)
+    cash = -np.cumsum(qty*price) - commission*np.cumsum(np.abs(qty))
+    equity = cash + position*close
+    drawdown = np.maximum.accumulate(equity) - equity if len(equity) else equity
+
+    placed = qty != 0
+    fills = pd.DataFrame({
+        'time': time[placed],
+        'side': np.where(qty[placed] > 0, 'Buy', 'Sell'),
+        'size': np.abs(qty[placed]),
+        'price': price[placed],
+        'ha_color': [CandleStore.COLOR_NAMES[int(c)] for c in colors[placed]],
+        'position': position[placed],
+    })
+    summary = {
+        'period': period,
+        'candles': len(time),
+        'fills': int(placed.sum()),
+        'pnl': float(equity[-1]) if len(equity) else 0.0,
+        'turnover': float(traded.sum()),
+        'position': int(position[-1]) if len(position) else 0,
+        'max_drawdown': float(drawdown.max()) if len(drawdown) else 0.0,
+    }
+    return fills, summary
+
+
+def run(bars, period, order_size=100, bar_size=None, use_prev_ha=True, fill='close', commission=0.0, calendar=None):
+    """
+        Backtest of the HA strategy on one bar period
+
+        Arguments
+        ---------
+        bars (dict):       column arrays, see load_bars()
+        period (int):      candle period in seconds, as --bar-period
+        order_size (int):  as --order-size
+        bar_size (int):    bar size in seconds. Inferred from bars if None
+        use_prev_ha (bool): see candles.HACandleBuilder
+        fill (str):        fill orders at the signal candle's 'close', or the
+            'next' candle's open
+        commission (float): per share
+        calendar (TradingCalendar): where periods are anchored, as
+            --exchange-tz/--session. Local midnight if None
+
+        Returns (fills, summary): fills as a DataFrame, summary as a dict
+            with the fill count, PnL, turnover, final position and max drawdown
+    """
+    (time, open, close, colors) = ha_candles(bars, period, bar_size, use_prev_ha, calendar)
+    return evaluate(time, open, close, colors, period, order_size, fill, commission)
+
+
+def main_cli(args):
+    # For running the backtest from the command line
+    bars = load_bars(args.file)
+    bar_size = args.bar_size or bar_size_of(bars['time'])
+    calendar = trading_calendar(args.exchange_tz, args.session, args.early_close)
+    results = []
+    for period in args.bar_period:
+        t0 = _time.perf_counter()
+        fills, summary = run(
+            bars, period, args.order_size, bar_size, fill=args.fill, commission=args.commission, calendar=calendar)
+        summary['secs'] = round(_time.perf_counter() - t0, 3)
+        results.append(summary)
+        if args.fills:
+            fills.insert(0, 'period', period)
+            fills.to_csv(args.fills, mode='a' if len(results) > 1 else 'w',
+                         header=len(results) == 1, index=False)
+    print(f'{len(bars["time"])} bars of {bar_size}s from {args.file}')
+    print(pd.DataFrame(results).to_string(index=False))
+
+
+def parse_args():
+    argp = argparse.ArgumentParser()
+    argp.add_argument("file", type=str, help="CSV or Parquet file of bars: time, open, high, low, close")
+    argp.add_argument(
+        "-b", "--bar-period", type=int, default=[60], nargs='+', help="bar time period(s) to test"
+    )
+    argp.add_argument(
+        "-s", "--order-size", type=int, default=100, help="Order size"
+    )
+    argp.add_argument(
+        "--bar-size", type=int, default=None, help="size of the bars in the file, in secs. Inferred if not given"
+    )
+    argp.add_argument(
+        "--exchange-tz", type=str, default=None, help="Exchange timezone the candle periods are aligned in, e.g. US/Eastern (default: local time)"
+    )
+    argp.add_argument(
+        "--session", type=str, default=None, nargs=2, metavar=('OPEN', 'CLOSE'), help="Session open and close, HH:MM in the exchange timezone. Candle periods start at the open and end at the close"
+    )
+    argp.add_argument(
+        "--early-close", type=str, default=[], nargs='+', help="Early close days, as YYYY-MM-DD@HH:MM"
+    )
+    argp.add_argument(
+        "--fill", type=str, default='close', help="Fill price: close (of the signal candle)/next (open of the next candle)"
+    )
+    argp.add_argument(
+        "--commission", type=float, default=0.0, help="Commission per share"
+    )
+    argp.add_argument(
+        "--fills", type=str, default=None, help="CSV file to write the fills to"
+    )
+
+    args = argp.parse_args()
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    main_cli(args)
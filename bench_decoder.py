@@ -0,0 +1,109 @@
+#!/usr/local/bin/python3
+
+import argparse
+import timeit
+
+from ibapi import comm
+from ibapi.decoder import Decoder
+from ibapi.message import IN
+from ibapi.utils import setHotPathLogging
+from ibapi.wrapper import EWrapper
+
+
+# One msg of each type with a fast decoder, see Decoder.msgId2fastMeth.
+# As sent by a server of SERVER_VERSION
+SERVER_VERSION = 151
+MSGS = {
+    'TICK_PRICE': f'{IN.TICK_PRICE}\0{3}\0{12}\0{4}\0{187.23}\0{300}\0{3}\0',
+    'TICK_SIZE': f'{IN.TICK_SIZE}\0{6}\0{12}\0{8}\0{1520}\0',
+    'ORDER_STATUS': f'{IN.ORDER_STATUS}\0{1004}\0Filled\0{100.0}\0{0.0}\0{187.25}\0{99123}\0{0}\0{187.25}\0{1}\0\0{0.0}\0',
+    'MARKET_DEPTH_L2': f'{IN.MARKET_DEPTH_L2}\0{1}\0{12}\0{3}\0ARCA\0{1}\0{0}\0{187.21}\0{400}\0{1}\0',
+    'REAL_TIME_BARS': f'{IN.REAL_TIME_BARS}\0{3}\0{12}\0{1600000005}\0{187.2}\0{187.3}\0{187.1}\0{187.25}\0{1200}\0{187.22}\0{14}\0',
+    'TICK_BY_TICK last': f'{IN.TICK_BY_TICK}\0{12}\0{1}\0{1600000005}\0{187.24}\0{100}\0{2}\0NYSE\0\0',
+    'TICK_BY_TICK bidask': f'{IN.TICK_BY_TICK}\0{12}\0{3}\0{1600000005}\0{187.23}\0{187.25}\0{200}\0{300}\0{0}\0',
+    'TICK_BY_TICK midpoint': f'{IN.TICK_BY_TICK}\0{12}\0{4}\0{1600000005}\0{187.24}\0',
+}
+
+
+class LastCallWrapper(EWrapper):
+    # Keeps the last callback and its args, in place of the logging EWrapper ones
+    def __init__(self):
+        EWrapper.__init__(self)
+        self.calls = []
+
+    def _call(name):
+        def method(self, *args):
+            self.calls.append((name, args))
+        return method
+
+    tickPrice = _call('tickPrice')
+    tickSize = _call('tickSize')
+    orderStatus = _call('orderStatus')
+    updateMktDepthL2 = _call('updateMktDepthL2')
+    realtimeBar = _call('realtimeBar')
+    tickByTickAllLast = _call('tickByTickAllLast')
+    tickByTickBidAsk = _call('tickByTickBidAsk')
+    tickByTickMidPoint = _call('tickByTickMidPoint')
+
+
+def _calls(fields, fast):
+    # The callbacks a decoder makes for fields, with their args as plain values
+    wrapper = LastCallWrapper()
+    Decoder(wrapper, SERVER_VERSION, fastDecode=fast).interpret(fields)
+    return [(name, tuple(vars(a) if hasattr(a, '__dict__') else a for a in args))
+            for (name, args) in wrapper.calls]
+
+
+def time_msg(fields, fast, number, repeat):
+    # Best us per Decoder.interpret() of fields
+    wrapper = LastCallWrapper()
+    decoder = Decoder(wrapper, SERVER_VERSION, fastDecode=fast)
+
+    def interpret():
+        decoder.interpret(fields)
+        wrapper.calls.clear()
+
+    return 1e6*min(timeit.repeat(interpret, number=number, repeat=repeat))/number
+
+
+def run(number, repeat):
+    """
+        Time Decoder.interpret() on each msg of MSGS, generic and fast,
+        after checking that both make the same callbacks with the same args
+
+        Returns [(msg, generic us, fast us)..]
+    """
+    rows = []
+    for (name, text) in MSGS.items():
+        fields = comm.read_fields(comm.make_msg(text)[4:])
+        assert _calls(fields, False) == _calls(fields, True), name
+        rows.append((name, time_msg(fields, False, number, repeat), time_msg(fields, True, number, repeat)))
+    return rows
+
+
+def main_cli(args):
+    # For running the benchmark from the command line
+    setHotPathLogging(args.hot_path_logging)
+    print(f'{"msg":<22} {"generic us":>10} {"fast us":>8} {"speedup":>8}')
+    for (name, generic, fast) in run(args.number, args.repeat):
+        print(f'{name:<22} {generic:>10.2f} {fast:>8.2f} {generic/fast:>7.1f}x')
+
+
+def parse_args():
+    argp = argparse.ArgumentParser(description="Per msg cost of Decoder.interpret(), generic vs fastDecode")
+    argp.add_argument(
+        "-n", "--number", type=int, default=20000, help="Msgs per timing"
+    )
+    argp.add_argument(
+        "-r", "--repeat", type=int, default=5, help="Timings per msg and decoder, the best one is kept"
+    )
+    argp.add_argument(
+        "--hot-path-logging", action='store_const', const=True, default=False, help="Leave ibapi's per msg debug logging on, as without MarketDataApp"
+    )
+
+    args = argp.parse_args()
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    main_cli(args)
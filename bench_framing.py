@@ -0,0 +1,157 @@
+#!/usr/local/bin/python3
+
+import argparse
+import queue
+import random
+import socket
+import sys
+import threading
+import time as _time
+
+from ibapi import comm
+from ibapi.connection import Connection
+from ibapi.message import IN
+from ibapi.reader import EReader
+
+
+def make_burst(n_bytes, seed=1):
+    # n_bytes or so of TICK_PRICE and HISTORICAL_DATA sized msgs. Returns (burst, n msgs)
+    rng = random.Random(seed)
+    msgs = []
+    size = 0
+    while size < n_bytes:
+        if rng.random() < 0.9:
+            msg = comm.make_msg(f'{IN.TICK_PRICE}\0{3}\0{rng.randrange(1000)}\0{4}\0{rng.uniform(50, 500)!r}\0{1}\0{0}\0')
+        else:
+            msg = comm.make_msg(f'{IN.HISTORICAL_DATA}\0' + 'x'*rng.randrange(100, 2000) + '\0')
+        msgs.append(msg)
+        size += len(msg)
+    return b''.join(msgs), len(msgs)
+
+
+def make_chunks(burst, max_chunk, seed=1):
+    # burst split as recv() would hand it out, in random 1 byte..max_chunk pieces
+    rng = random.Random(seed)
+    chunks = []
+    pos = 0
+    while pos < len(burst):
+        n = rng.randint(1, max_chunk)
+        chunks.append(burst[pos:pos + n])
+        pos += n
+    return chunks
+
+
+def frame_legacy(chunks):
+    # The EReader loop before FrameBuffer: buf += data, then read_msg() copies the rest after each msg
+    n = 0
+    buf = b''
+    for data in chunks:
+        buf += data
+        while len(buf) > 0:
+            (size, msg, buf) = comm.read_msg(buf)
+            if msg:
+                n += 1
+            else:
+                break
+    return n
+
+
+def frame_buffer(chunks):
+    # The EReader loop on a FrameBuffer, copying each msg out as it does
+    n = 0
+    buf = comm.FrameBuffer()
+    for data in chunks:
+        buf.write(data)
+        for (size, msg) in buf.frames():
+            bytes(msg)
+            n += 1
+    return n
+
+
+def ereader(burst):
+    # burst sent over a local TCP connection to an EReader. Returns (n msgs queued, secs)
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    conn = Connection('127.0.0.1', listener.getsockname()[1])
+    conn.connect()
+    (server, _) = listener.accept()
+    listener.close()
+    msg_queue = queue.Queue()
+    reader = EReader(conn, msg_queue)
+    reader.start()
+
+    def send():
+        server.sendall(burst)
+        server.close()
+
+    t0 = _time.perf_counter()
+    threading.Thread(target=send, daemon=True).start()
+    reader.join()
+    secs = _time.perf_counter() - t0
+    return msg_queue.qsize(), secs
+
+
+def run(sizes_mb, max_chunk, legacy_max_mb):
+    """
+        Frame bursts of each size in sizes_mb MB, fed in random 1 byte to
+        max_chunk pieces, with the old read_msg() loop (up to legacy_max_mb
+        MB, as it is quadratic) and with FrameBuffer, and send each through
+        an EReader over a local connection
+
+        Returns [(MB, msgs, legacy MB/s, FrameBuffer MB/s, EReader MB/s)..]
+    """
+    rows = []
+    for size_mb in sizes_mb:
+        (burst, n_msgs) = make_burst(int(size_mb*2**20))
+        chunks = make_chunks(burst, max_chunk)
+        mb = len(burst)/2**20
+        legacy = float('nan')
+        if size_mb <= legacy_max_mb:
+            t0 = _time.perf_counter()
+            assert frame_legacy(chunks) == n_msgs
+            legacy = mb/(_time.perf_counter() - t0)
+        t0 = _time.perf_counter()
+        assert frame_buffer(chunks) == n_msgs
+        framed = mb/(_time.perf_counter() - t0)
+        (n, secs) = ereader(burst)
+        assert n == n_msgs, (n, n_msgs)
+        rows.append((size_mb, n_msgs, legacy, framed, mb/secs))
+    return rows
+
+
+def main_cli(args):
+    # For running the benchmark from the command line. Exits 1 if not linear
+    print(f'{"MB":>6} {"msgs":>8} {"legacy MB/s":>12} {"buffer MB/s":>12} {"EReader MB/s":>13}')
+    rows = run(args.sizes, args.max_chunk, args.legacy_max)
+    for (size_mb, n_msgs, legacy, framed, read) in rows:
+        print(f'{size_mb:>6g} {n_msgs:>8} {legacy:>12.1f} {framed:>12.1f} {read:>13.1f}')
+    # Linear: the throughput holds up as the bursts grow
+    ratio = min(rows[-1][3]/rows[0][3], rows[-1][4]/rows[0][4])
+    linear = ratio >= args.min_ratio
+    print(f'throughput at {rows[-1][0]:g} MB / at {rows[0][0]:g} MB: {ratio:.2f}'
+          f' ({"linear" if linear else "NOT linear"}, min {args.min_ratio})')
+    return linear
+
+
+def parse_args():
+    argp = argparse.ArgumentParser(description="Framing throughput of multi-MB bursts: read_msg() loop vs FrameBuffer vs EReader")
+    argp.add_argument(
+        "-s", "--sizes", type=float, default=[1, 2, 4, 8, 16, 32], nargs='+', help="Burst sizes in MB"
+    )
+    argp.add_argument(
+        "--max-chunk", type=int, default=2**20, help="Largest piece the bursts are fed in, in bytes. The old recvMsg() drained the socket, so up to its buffer size"
+    )
+    argp.add_argument(
+        "--legacy-max", type=float, default=8, help="Largest burst to run the old quadratic loop on, in MB"
+    )
+    argp.add_argument(
+        "--min-ratio", type=float, default=0.5, help="Throughput at the largest size over the smallest, below which the framing is not linear"
+    )
+
+    args = argp.parse_args()
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    sys.exit(0 if main_cli(args) else 1)
@@ -0,0 +1,100 @@
+#!/usr/local/bin/python3
+
+import argparse
+import logging
+import os
+import socket
+import threading
+import time as _time
+
+from ibapi import comm
+from ibapi.client import EClient
+from ibapi.utils import (setHotPathLogging, setWireTrace)
+
+import fake_gateway
+from bench_decoder import (MSGS, LastCallWrapper, time_msg)
+
+
+# (label, hot path logging, wire trace every) of each run
+MODES = (
+    ('hot path logging on', True, 0),
+    ('hot path logging off', False, 0),
+    ('off, wire trace 1/1000', False, 1000),
+)
+
+
+def stream(n_msgs):
+    """
+        n_msgs of MSGS in turn, sent in one burst from a local fake gateway
+        to an EClient, generic decoding. Times the client's EReader and run()
+        loop from the first msg until it has decoded them all
+
+        Returns msgs/sec
+    """
+    msgs = [comm.make_msg(text) for text in MSGS.values()]
+    burst = b''.join(msgs[i % len(msgs)] for i in range(n_msgs))
+    gateway = fake_gateway.FakeGateway()
+    accept = threading.Thread(target=gateway.wait_clients, args=(1,), daemon=True)
+    accept.start()
+    client = EClient(LastCallWrapper(), fastDecode=False)
+    client.connect('127.0.0.1', gateway.port, 0)
+    accept.join()
+
+    def send():
+        # then a FIN, and wait for the client to close: closing with its
+        # startApi msg unread would reset the connection
+        sock = gateway.clients[0]
+        sock.sendall(burst)
+        sock.shutdown(socket.SHUT_WR)
+        while gateway.clients:
+            gateway.poll(0.1)
+        gateway.close()
+
+    t0 = _time.perf_counter()
+    threading.Thread(target=send, daemon=True).start()
+    client.run()
+    return n_msgs/(_time.perf_counter() - t0)
+
+
+def main_cli(args):
+    # For running the benchmark from the command line
+    # Logging as IB_trader.py's default, to a file, at WARNING
+    logging.basicConfig(filename=os.devnull, level=logging.WARNING)
+    # The modes take turns, so drifts in the machine's speed hit them alike
+    fields = {name: comm.read_fields(comm.make_msg(text)[4:]) for (name, text) in MSGS.items()}
+    decode_us = [dict.fromkeys(MSGS, float('inf')) for _ in MODES]
+    rates = [0.0 for _ in MODES]
+    for _ in range(args.repeat):
+        for (i, (label, hot_path, every)) in enumerate(MODES):
+            setHotPathLogging(hot_path)
+            setWireTrace(every)
+            for name in MSGS:
+                decode_us[i][name] = min(decode_us[i][name], time_msg(fields[name], False, args.number, 1))
+            rates[i] = max(rates[i], stream(args.msgs))
+    rows = list(zip((label for (label, _, _) in MODES), decode_us, rates))
+    setWireTrace(0)
+
+    print(f'{"generic decode, us/msg":<22}' + ''.join(f' {label:>22}' for (label, _, _) in rows))
+    for name in MSGS:
+        print(f'{name:<22}' + ''.join(f' {decode_us[name]:>22.2f}' for (_, decode_us, _) in rows))
+    print(f'{"EReader+run(), msgs/s":<22}' + ''.join(f' {rate:>22.0f}' for (_, _, rate) in rows))
+
+
+def parse_args():
+    argp = argparse.ArgumentParser(description="Cost of ibapi's hot path debug logging, on vs off, with the logger at WARNING")
+    argp.add_argument(
+        "-n", "--number", type=int, default=20000, help="Msgs per decode timing"
+    )
+    argp.add_argument(
+        "-r", "--repeat", type=int, default=5, help="Timings per msg and mode, the best one is kept"
+    )
+    argp.add_argument(
+        "-m", "--msgs", type=int, default=100000, help="Msgs per stream through the EReader and run() loop"
+    )
+
+    args = argp.parse_args()
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    main_cli(args)
@@ -0,0 +1,110 @@
+#!/usr/local/bin/python3
+
+import argparse
+import threading
+import time as _time
+import numpy as np
+
+from ibapi.client import EClient
+from ibapi.wrapper import EWrapper
+from ibapi.reader import ESelectorReader
+
+import fake_gateway
+
+
+class LatencyApp(EWrapper, EClient):
+    # Client that records monotonic() - price of each tick, see FakeGateway
+    def __init__(self, selectorReader=None):
+        EWrapper.__init__(self)
+        EClient.__init__(self, wrapper=self, selectorReader=selectorReader, fastDecode=True)
+        self.latencies = []
+
+    def tickPrice(self, reqId, tickType, price, attrib):
+        self.latencies.append(_time.monotonic() - price)
+
+    def tickSize(self, reqId, tickType, size):
+        pass
+
+    def error(self, reqId, errorCode, errorString, *args):
+        pass
+
+
+def run_one(mode, n_clients, rate, duration):
+    """
+        Connect n_clients to a fake gateway in its own process, each with its
+        own EReader thread (mode 'thread') or all on one ESelectorReader
+        (mode 'selector'), and have them receive rate ticks/sec for duration
+        secs
+
+        Returns a dict of the threads in use while streaming, the CPU used by
+        this process as a % of one core, and the tick latency percentiles in ms
+    """
+    (gateway, port) = fake_gateway.start(n_clients, rate, duration)
+    selector = ESelectorReader() if mode == 'selector' else None
+    apps = [LatencyApp(selector) for _ in range(n_clients)]
+    for (client_id, app) in enumerate(apps):
+        app.connect('127.0.0.1', port, client_id)
+    loops = [threading.Thread(target=app.run, daemon=True) for app in apps]
+    for loop in loops:
+        loop.start()
+
+    # sample mid stream, the gateway starts once all are connected
+    t0 = _time.monotonic()
+    cpu0 = _time.process_time()
+    _time.sleep(duration/2)
+    threads = threading.active_count()
+    gateway.join(duration + 30)
+    for loop in loops:
+        loop.join(5)
+    wall = _time.monotonic() - t0
+    cpu = _time.process_time() - cpu0
+    if selector is not None:
+        selector.stop()
+        selector.join(5)
+
+    latencies = np.concatenate([np.asarray(app.latencies) for app in apps]) * 1000.0
+    return {
+        'mode': mode,
+        'clients': n_clients,
+        'threads': threads,
+        'cpu_pct': 100.0*cpu/wall,
+        'ticks': len(latencies),
+        'p50_ms': np.percentile(latencies, 50) if len(latencies) else np.nan,
+        'p99_ms': np.percentile(latencies, 99) if len(latencies) else np.nan,
+        'max_ms': latencies.max() if len(latencies) else np.nan,
+    }
+
+
+def main_cli(args):
+    # For running the benchmark from the command line
+    print(f'{"mode":>8} {"clients":>7} {"threads":>7} {"cpu%":>6} {"ticks":>8} '
+          f'{"p50 ms":>8} {"p99 ms":>8} {"max ms":>8}')
+    for n_clients in args.clients:
+        for mode in args.mode:
+            r = run_one(mode, n_clients, args.rate, args.duration)
+            print(f'{r["mode"]:>8} {r["clients"]:>7} {r["threads"]:>7} {r["cpu_pct"]:>6.1f} {r["ticks"]:>8} '
+                  f'{r["p50_ms"]:>8.3f} {r["p99_ms"]:>8.3f} {r["max_ms"]:>8.3f}')
+
+
+def parse_args():
+    argp = argparse.ArgumentParser(
+        description="Threads, CPU and tick latency of EReader vs ESelectorReader against a local fake gateway")
+    argp.add_argument(
+        "-n", "--clients", type=int, default=[10, 100, 500], nargs='+', help="Connection counts to run"
+    )
+    argp.add_argument(
+        "-m", "--mode", type=str, default=['thread', 'selector'], nargs='+', help="Readers to run (thread/selector)"
+    )
+    argp.add_argument(
+        "-r", "--rate", type=float, default=20.0, help="Ticks per sec to each connection"
+    )
+    argp.add_argument(
+        "-d", "--duration", type=float, default=10.0, help="Secs to stream for, per run"
+    )
+
+    args = argp.parse_args()
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    main_cli(args)
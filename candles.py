@@ -0,0 +1,746 @@
+import datetime as dt
+import logging
+import os
+import threading
+import time as _time
+
+import numpy as np
+import pandas as pd
+import pytz
+
+
+class CandleStore:
+    """
+        Fixed capacity, array backed store of HA candles
+
+        Rows are written twice, at i and i + capacity, so the newest
+        `capacity` rows are always one contiguous slice. Appends are O(1),
+        the last N rows are a view, and to_frame() wraps them in a
+        DataFrame without copying the numeric columns.
+
+        With a spill_path, candles are appended to that file, in SPILL_DTYPE
+        records, before they drop out of the window, so memory stays bounded
+        while the full history is kept. history() memory-maps the file, so
+        older candles are only read from disk when they are accessed.
+        The file may be from an earlier run, eg one restarted with a warm-up:
+        candles no later than its last record are not written again.
+
+        Arguments
+        ---------
+        capacity (int):   number of most recent candles kept in memory
+        spill_path (str): append-only file for the candles leaving the window. None to drop them
+    """
+
+    COLUMNS = ('time', 'open', 'high', 'low', 'close', 'ha_open', 'ha_close', 'ha_high', 'ha_low')
+    COLORS = {'Green': 1, 'Red': -1, None: 0}
+    COLOR_NAMES = {1: 'Green', -1: 'Red', 0: None}
+    SPILL_DTYPE = np.dtype([(c, np.float64) for c in COLUMNS] + [('ha_color', np.int8)])
+
+    def __init__(self, capacity=10000, spill_path=None):
+        self.capacity = capacity
+        self.col_idx = {c: i for i, c in enumerate(CandleStore.COLUMNS)}
+        self._data = np.zeros((2*capacity, len(CandleStore.COLUMNS)), dtype=np.float64)
+        self._color = np.zeros(2*capacity, dtype=np.int8)
+        self._pos = 0 # Next write position, in [0, capacity)
+        self.count = 0 # Total candles appended since creation
+        self.spill_path = spill_path
+        self.spilled = 0 # Candles appended since creation that are in the spill file
+        self._spill_file = None
+        if spill_path is not None:
+            os.makedirs(os.path.dirname(spill_path) or '.', exist_ok=True)
+            self._spill_file = open(spill_path, 'ab')
+        # Time of the spill file's last record, only later candles are written to it
+        records = CandleStore.read_spill(spill_path) if spill_path is not None else []
+        self._spill_last_time = float(records['time'][-1]) if len(records) else -np.inf
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, time, open, high, low, close, ha_open, ha_close, ha_high, ha_low, ha_color):
+        if self._spill_file is not None and self.spilled <= self.count - self.capacity:
+            # The oldest row is about to be overwritten. Spill it along with
+            # the next ones, to write in blocks
+            self._spill(min(self.count, self.spilled + max(1, self.capacity//8)))
+        row = (time, open, high, low, close, ha_open, ha_close, ha_high, ha_low)
+        self._data[self._pos] = row
+        self._data[self._pos + self.capacity] = row
+        code = CandleStore.COLORS[ha_color]
+        self._color[self._pos] = code
+        self._color[self._pos + self.capacity] = code
+        self._pos = (self._pos + 1) % self.capacity
+        self.count += 1
+
+    def extend(self, time, open, high, low, close, ha_open, ha_close, ha_high, ha_low, ha_color):
+        # Bulk append of column arrays. ha_color as COLORS codes
+        rows = np.column_stack((time, open, high, low, close, ha_open, ha_close, ha_high, ha_low))
+        codes = np.asarray(ha_color, dtype=np.int8)
+        n = len(rows)
+        if self._spill_file is not None and self.spilled < self.count + n - self.capacity:
+            self._spill(min(self.count, self.count + n - self.capacity))
+            if n > self.capacity:
+                # Rows that never make it into the window go straight to the file
+                self._write_spill(rows[:n - self.capacity], codes[:n - self.capacity])
+                self.spilled += n - self.capacity
+        if n > self.capacity:
+            rows, codes = rows[-self.capacity:], codes[-self.capacity:]
+        # Row i of the n goes where append() would have put it, keeping _pos == count % capacity
+        idx = (self._pos + n - len(rows) + np.arange(len(rows))) % self.capacity
+        self._data[idx] = rows
+        self._data[idx + self.capacity] = rows
+        self._color[idx] = codes
+        self._color[idx + self.capacity] = codes
+        self._pos = (self._pos + n) % self.capacity
+        self.count += n
+
+    def _spill(self, stop):
+        # Append the in memory rows from self.spilled up to stop to the spill file
+        if stop <= self.spilled:
+            return
+        start = self.spilled % self.capacity
+        end = start + stop - self.spilled
+        self._write_spill(self._data[start:end], self._color[start:end])
+        self.spilled = stop
+
+    def _write_spill(self, rows, codes):
+        new = rows[:, 0] > self._spill_last_time
+        if not new.all():
+            # Already in the file, from an earlier run
+            rows, codes = rows[new], codes[new]
+            if len(rows) == 0:
+                return
+        self._spill_last_time = rows[-1, 0]
+        records = np.empty(len(rows), dtype=CandleStore.SPILL_DTYPE)
+        for i, col in enumerate(CandleStore.COLUMNS):
+            records[col] = rows[:, i]
+        records['ha_color'] = codes
+        self._spill_file.write(records.tobytes())
+        self._spill_file.flush()
+
+    def flush(self):
+        # Spill all candles, including those still in the window. Can be called any time
+        if self._spill_file is not None:
+            self._spill(self.count)
+
+    def close(self):
+        if self._spill_file is not None:
+            self.flush()
+            self._spill_file.close()
+            self._spill_file = None
+
+    def history(self):
+        # Spilled candles as a read-only memory map of SPILL_DTYPE records,
+        # oldest first. Includes earlier runs appending to the same file
+        if self.spill_path is None:
+            return np.empty(0, dtype=CandleStore.SPILL_DTYPE)
+        return CandleStore.read_spill(self.spill_path)
+
+    def history_frame(self, start=None, stop=None):
+        # Slice of history() as a DataFrame, like to_frame()
+        records = self.history()[start:stop]
+        df = pd.DataFrame({col: records[col] for col in CandleStore.COLUMNS})
+        df['ha_color'] = [CandleStore.COLOR_NAMES[int(c)] for c in records['ha_color']]
+        return df
+
+    @staticmethod
+    def read_spill(path):
+        # Memory map of a spill file, see history()
+        if not os.path.exists(path) or os.path.getsize(path) < CandleStore.SPILL_DTYPE.itemsize:
+            return np.empty(0, dtype=CandleStore.SPILL_DTYPE)
+        n = os.path.getsize(path) // CandleStore.SPILL_DTYPE.itemsize
+        return np.memmap(path, dtype=CandleStore.SPILL_DTYPE, mode='r', shape=(n,))
+
+    def _span(self, n):
+        # Slice bounds of the last n rows in the doubled buffers
+        n = len(self) if n is None else min(n, len(self))
+        end = self._pos + self.capacity
+        return end - n, end
+
+    def last(self, col, i=-1):
+        # Value of column col, i rows back from the end (-1 is the newest)
+        if not -len(self) <= i < 0:
+            raise IndexError(i)
+        return self._data[self._pos + self.capacity + i, self.col_idx[col]]
+
+    def color(self, i=-1):
+        # 'Green', 'Red' or None (indecision), i rows back from the end
+        if not -len(self) <= i < 0:
+            raise IndexError(i)
+        return CandleStore.COLOR_NAMES[int(self._color[self._pos + self.capacity + i])]
+
+    def tail(self, n=None):
+        # (rows x COLUMNS) float64 view and int8 color codes of the last n rows
+        start, end = self._span(n)
+        return self._data[start:end], self._color[start:end]
+
+    def column(self, col, n=None):
+        start, end = self._span(n)
+        return self._data[start:end, self.col_idx[col]]
+
+    def to_frame(self, n=None):
+        data, colors = self.tail(n)
+        df = pd.DataFrame(data, columns=CandleStore.COLUMNS, copy=False)
+        df['ha_color'] = [CandleStore.COLOR_NAMES[int(c)] for c in colors]
+        return df
+
+
+class BarAggregator:
+    """
+        Running OHLC of the real-time bars received in the current period
+
+        Each update is folded in as it arrives, so memory and the work left
+        at the end of the period are constant whatever the bar period is.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.start = None # Time of the first bar in the period
+        self.end = None # Time of the latest bar in the period
+        self.open = None
+        self.high = None
+        self.low = None
+        self.close = None
+
+    def update(self, time, open, high, low, close):
+        if self.count == 0:
+            self.start = time
+            self.open = open
+            self.high = high
+            self.low = low
+        else:
+            if high > self.high:
+                self.high = high
+            if low < self.low:
+                self.low = low
+        self.end = time
+        self.close = close
+        self.count += 1
+
+    def ohlc(self):
+        return (self.open, self.high, self.low, self.close)
+
+
+# (a + b)/2 as a ufunc, for exact HA open recurrences with accumulate()
+_halfway = np.frompyfunc(lambda a, b: (a + b)/2, 2, 1)
+
+
+def ha_series(open, high, low, close, prev=None, use_prev_ha=True):
+    """
+        HA columns of a run of raw candles, vectorized
+
+        Same arithmetic, in the same order, as HACandleBuilder does one
+        candle at a time, so warm-up candles match the live ones exactly.
+
+        Arguments
+        ---------
+        open, high, low, close (np.ndarray): raw candles, oldest first
+        prev (tuple): (open, close, ha_open, ha_close) of the candle before
+            the run. None if there is none
+        use_prev_ha (bool): see HACandleBuilder
+
+        Returns (ha_open, ha_close, ha_high, ha_low, ha_color) with
+        ha_color as CandleStore.COLORS codes
+    """
+    ha_c = (open + high + low + close)/4
+    if use_prev_ha:
+        # ha_open[i] = (ha_open[i-1] + ha_close[i-1])/2
+        seed = (open[0] + close[0])/2 if prev is None else (prev[2] + prev[3])/2
+        ha_o = _halfway.accumulate(np.r_[seed, ha_c[:-1]].astype(object)).astype(np.float64)
+    else:
+        prev_o = open[0] if prev is None else prev[0]
+        prev_c = close[0] if prev is None else prev[1]
+        ha_o = (np.r_[prev_o, open[:-1]] + np.r_[prev_c, close[:-1]])/2
+    ha_h = np.maximum(np.maximum(high, ha_o), ha_c)
+    ha_l = np.minimum(np.minimum(low, ha_o), ha_c)
+    if use_prev_ha and prev is None:
+        # No prior HA candle for the first one
+        ha_h[0] = high[0]
+        ha_l[0] = low[0]
+    ha_color = np.sign(ha_c - ha_o).astype(np.int8)
+    return ha_o, ha_c, ha_h, ha_l, ha_color
+
+
+class TradingCalendar:
+    """
+        Where candle periods are anchored, day by day
+
+        Without a session, periods run from midnight. With one, they run
+        from the session open to its close, early closes included, and then
+        from the close to the next open for the bars outside the session.
+        Times are in the exchange timezone, DST included.
+
+        Arguments
+        ---------
+        tz (str):           exchange timezone, e.g. 'US/Eastern'. None for local time
+        session (tuple):    ('HH:MM', 'HH:MM') open and close. None for whole days
+        early_closes (dict): {datetime.date: 'HH:MM'} days closing before session[1]
+    """
+
+    def __init__(self, tz=None, session=None, early_closes=None):
+        self.tz = pytz.timezone(tz) if tz else None
+        self.session = None
+        if session is not None:
+            self.session = tuple(dt.datetime.strptime(t, '%H:%M').time() for t in session)
+        self.early_closes = {
+            day: dt.datetime.strptime(t, '%H:%M').time() for day, t in (early_closes or {}).items()}
+        self._anchors = {} # date -> anchor epoch times
+
+    def date_of(self, t):
+        return dt.datetime.fromtimestamp(t, self.tz).date()
+
+    def anchors(self, day):
+        # Epoch times the periods of date day are anchored at, in order
+        anchors = self._anchors.get(day)
+        if anchors is None:
+            if self.session is None:
+                times = (dt.time(0),)
+            else:
+                times = (self.session[0], self.early_closes.get(day, self.session[1]))
+            anchors = self._anchors[day] = tuple(self._epoch(day, t) for t in times)
+        return anchors
+
+    def _epoch(self, day, time):
+        naive = dt.datetime.combine(day, time)
+        if self.tz is None:
+            return int(naive.timestamp())
+        return int(self.tz.localize(naive).timestamp())
+
+    def segments(self, first_day, last_day):
+        # (start, end) epoch times between consecutive anchors, from the day
+        # before first_day to the day after last_day
+        anchors = []
+        day = first_day - dt.timedelta(days=1)
+        while day <= last_day + dt.timedelta(days=1):
+            anchors.extend(self.anchors(day))
+            day += dt.timedelta(days=1)
+        return list(zip(anchors[:-1], anchors[1:]))
+
+
+class PeriodSchedule:
+    """
+        Period boundaries of one bar period, as epoch seconds
+
+        Periods start at each calendar anchor and every period seconds after
+        it. The last one before the next anchor is cut short there, so
+        periods that do not divide a day (or a session) do not drift. The
+        boundaries of a period are computed once, callers then just compare
+        times against them.
+
+        Arguments
+        ---------
+        period (int): period in seconds
+        calendar (TradingCalendar): None for local midnight anchored periods
+    """
+
+    def __init__(self, period, calendar=None):
+        self.period = period
+        self.calendar = calendar if calendar is not None else TradingCalendar()
+
+    def bounds(self, t):
+        # (start, end) of the period epoch time t falls in
+        day = self.calendar.date_of(t)
+        for (a_start, a_end) in self.calendar.segments(day, day):
+            if a_start <= t < a_end:
+                start = a_start + int(t - a_start)//self.period*self.period
+                return start, min(start + self.period, a_end)
+        raise ValueError(f'No period for time {t}')
+
+    def next_boundary(self, t):
+        return self.bounds(t)[1]
+
+    def grid(self, t0, t1):
+        # All boundaries from the start of t0's period to the end of t1's, as an int64 array
+        segments = self.calendar.segments(self.calendar.date_of(t0), self.calendar.date_of(t1))
+        grid = np.unique(np.concatenate(
+            [np.r_[np.arange(a_start, a_end, self.period), a_end] for (a_start, a_end) in segments]))
+        first = np.searchsorted(grid, t0, side='right') - 1
+        last = np.searchsorted(grid, t1, side='right')
+        return grid[first:last + 1].astype(np.int64)
+
+
+def aggregate_periods(time, open, high, low, close, bar_size, period, rt_bar_period=5, schedule=None):
+    """
+        Whole period OHLC candles from shorter bars, vectorized
+
+        Periods with missing bars are dropped. Candles are stamped like the
+        live ones: start time of the last real-time bar in the period.
+
+        Arguments
+        ---------
+        time, open, high, low, close (np.ndarray): bars, oldest first.
+            time is the bar start, in epoch seconds
+        bar_size (int): bar size in seconds. Must divide period
+        period (int):   candle period in seconds
+        schedule (PeriodSchedule): period boundaries. Local midnight anchored if None
+
+        Returns (time, open, high, low, close) of the candles
+    """
+    if not len(time):
+        return (np.array([], dtype=np.int64),) + (np.array([]),)*4
+    schedule = schedule if schedule is not None else PeriodSchedule(period)
+    time = np.asarray(time, dtype=np.int64)
+    grid = schedule.grid(time[0], time[-1])
+    keys = np.searchsorted(grid, time, side='right') - 1
+    starts = np.flatnonzero(np.r_[True, np.diff(keys) != 0])
+    ends = np.r_[starts[1:], len(time)]
+    period_start = grid[keys[starts]]
+    period_end = grid[keys[starts] + 1]
+    whole = (time[starts] == period_start) & (ends - starts == (period_end - period_start) // bar_size)
+    return (
+        period_end[whole] - rt_bar_period,
+        open[starts][whole],
+        np.maximum.reduceat(high, starts)[whole],
+        np.minimum.reduceat(low, starts)[whole],
+        close[ends - 1][whole])
+
+
+class HACandleBuilder:
+    """
+        Heikin-Ashi candles of one bar period, built from real-time bars
+
+        Arguments
+        ---------
+        period (int):        candle period in seconds
+        rt_bar_period (int): period of the real-time bars fed to update()
+        use_prev_ha (bool):  HA open from the previous HA candle (True) or
+            from the previous raw candle (False)
+        capacity, spill_path: see CandleStore
+        calendar (TradingCalendar): where periods are anchored. Local midnight if None
+    """
+
+    def __init__(self, period, rt_bar_period=5, use_prev_ha=True, capacity=10000, spill_path=None, calendar=None):
+        self.period = period
+        self.rt_bar_period = rt_bar_period
+        self.use_prev_ha = use_prev_ha
+        self.schedule = PeriodSchedule(period, calendar)
+        self.period_start = None # Bounds of the period in progress, from self.schedule
+        self.period_end = None
+        self.candles = CandleStore(capacity, spill_path)
+        self.cache = BarAggregator() # OHLC of the real-time bars so far in this period
+        self.held = None # Real-time bars received while waiting for warm-up history
+        self.history = None # Warm-up history waiting for the first real-time bar
+        self.logger = logging.getLogger(__name__)
+
+    def hold(self):
+        # Buffer real-time bars until warm_up() has seeded the candles
+        if self.held is None:
+            self.held = []
+
+    def warm_up(self, time, open, high, low, close, bar_size):
+        """
+            Seed the candles from historical bars
+
+            The bars are aggregated to self.period, only whole periods that
+            end before the first real-time bar are kept, and the bars of the
+            period in progress prefill the aggregation of the live one.
+            Until a real-time bar arrives the history is kept aside, so no
+            candle is lost between the last historical and first live one.
+
+            Arguments
+            ---------
+            time, open, high, low, close (np.ndarray): historical bars,
+                oldest first. time is the bar start, in epoch seconds
+            bar_size (int): historical bar size in seconds. Must divide self.period
+
+            Returns the live candles completed by the buffered real-time bars
+        """
+        self.hold()
+        self.history = (
+            np.asarray(time, dtype=np.int64), np.asarray(open, dtype=np.float64),
+            np.asarray(high, dtype=np.float64), np.asarray(low, dtype=np.float64),
+            np.asarray(close, dtype=np.float64), bar_size)
+        if not self.held:
+            return []
+        return self._finish_warm_up()
+
+    def update(self, time, open, high, low, close):
+        # Returns the new candle if this update completes one, else None
+        if self.held is not None:
+            self.held.append((time, open, high, low, close))
+            if self.history is None:
+                return None
+            candles = self._finish_warm_up()
+            return candles[-1] if candles else None
+        if self.period_end is not None and time >= self.period_end:
+            # Bars missing up to the end of the period. Drop it
+            self.logger.warning(f'Incomplete {self.period}s candle dropped, next bar at {time}')
+            self.cache.reset()
+            self.period_end = None
+        if self.period_end is None:
+            self.period_start, self.period_end = self.schedule.bounds(time)
+        self.cache.update(time, open, high, low, close)
+        candle = None
+        if self._ends_period(time):
+            # On HA candle tick point
+            candle = self._update_candles()
+            self.cache.reset()
+            self.period_end = None
+        return candle
+
+    def _finish_warm_up(self):
+        (time, open, high, low, close, bar_size) = self.history
+        held, self.held, self.history = self.held, None, None
+        live_start = held[0][0]
+        # The bar live_start falls in overlaps the first live ones. Kept anyway,
+        # since the overlap cannot change a high/low, and it fills the gap up to them
+        keep = time < live_start
+        if len(self.candles):
+            keep &= time > self.candles.last('time')
+        time, open, high, low, close = time[keep], open[keep], high[keep], low[keep], close[keep]
+        self.cache.reset()
+        self.period_end = None
+        if len(time):
+            live_period_start, _ = self.schedule.bounds(live_start)
+            done = time < live_period_start
+            self._extend_history(
+                time[done], open[done], high[done], low[done], close[done], bar_size)
+            # Bars of the period in progress, if they run from its start up to the live ones
+            pre = ~done
+            if (pre.any() and time[pre][0] == live_period_start and time[pre][-1] + bar_size >= live_start
+                    and np.all(np.diff(time[pre]) == bar_size)):
+                for bar in zip(time[pre].tolist(), open[pre].tolist(), high[pre].tolist(),
+                               low[pre].tolist(), close[pre].tolist()):
+                    self.cache.update(*bar)
+        self.logger.info(f'Warmed up {self.period}s candles: {len(self.candles)}')
+        candles = (self.update(*bar) for bar in held)
+        return [c for c in candles if c is not None]
+
+    def _extend_history(self, time, open, high, low, close, bar_size):
+        # Append the HA candles of whole periods of historical bars
+        (time, open, high, low, close) = aggregate_periods(
+            time, open, high, low, close, bar_size, self.period, self.rt_bar_period, self.schedule)
+        if not len(time):
+            return
+        prev = None
+        if len(self.candles):
+            prev = tuple(self.candles.last(col) for col in ('open', 'close', 'ha_open', 'ha_close'))
+        ha = ha_series(open, high, low, close, prev, self.use_prev_ha)
+        self.candles.extend(time, open, high, low, close, *ha)
+
+    def _ends_period(self, time):
+        # True if the bar starting at time is the last of the period
+        # Add bar period below becoz ts received from IB represents beginning of bar
+        return time + self.rt_bar_period >= self.period_end
+
+    def _update_candles(self):
+        # Bar completed
+        if self.cache.start == self.period_start:
+            # Hit the candle period boundary. Update HA candles
+            _pd = self._calc_new_candle()
+            self.candles.append(**_pd)
+            return _pd
+        else:
+            # First iteration. Not enough updates for a full period
+            self.logger.info('Not enough data for a candle')
+            return None
+
+    def _calc_new_candle(self):
+        ohlc = self.cache.ohlc()
+        ha_c = (ohlc[0] + ohlc[1] + ohlc[2] + ohlc[3])/4
+        if self.use_prev_ha:
+            if len(self.candles) == 0:
+                # No prior HA candle is available, use prev raw candle open/close
+                #ha_o = (self.candles.last('open') + self.candles.last('close'))/2
+                ha_o = (ohlc[0] + ohlc[3])/2
+                ha_h = ohlc[1]
+                ha_l = ohlc[2]
+            else:
+                ha_o = (self.candles.last('ha_open') + self.candles.last('ha_close'))/2
+                ha_h = max(ohlc[1], ha_o, ha_c)
+                ha_l = min(ohlc[2], ha_o, ha_c)
+        else:
+            ha_o = (self.candles.last('open') + self.candles.last('close'))/2
+            ha_h = max(ohlc[1], ha_o, ha_c)
+            ha_l = min(ohlc[2], ha_o, ha_c)
+        if ha_c > ha_o:
+            ha_color = 'Green'
+        elif ha_c < ha_o:
+            ha_color = 'Red'
+        else:
+            # Indecision candle
+            ha_color = None
+        ha_ochl = (ha_o, ha_c, ha_h, ha_l, ha_color)
+        _pd = {
+            'time': self.cache.end,
+            'open': ohlc[0],
+            'high': ohlc[1],
+            'low': ohlc[2],
+            'close': ohlc[3],
+            'ha_open': ha_ochl[0],
+            'ha_close': ha_ochl[1],
+            'ha_high': ha_ochl[2],
+            'ha_low': ha_ochl[3],
+            'ha_color': ha_ochl[4],
+        }
+        return _pd
+
+
+class TickCandleBuilder(HACandleBuilder):
+    """
+        HA candles of one bar period, built from ticks and closed by the clock
+
+        update() folds ticks in as they arrive, with open, high, low and close
+        all the tick price. A period is ended by close(), called on a timer
+        right at its boundary (see TickBarEngine), so the candle does not wait
+        for the last real-time bar of the period. A tick from a later period
+        ends it too, should it beat the timer. Candles are stamped like the
+        real-time bar ones, rt_bar_period before the period end.
+    """
+
+    def __init__(self, period, rt_bar_period=5, use_prev_ha=True, capacity=10000, spill_path=None, calendar=None):
+        super().__init__(period, rt_bar_period, use_prev_ha, capacity, spill_path, calendar)
+        self.since = None # Start of the first update. Periods from there on are whole
+
+    def update(self, time, open, high, low, close):
+        candle = None
+        if self.held is None and self.period_end is not None and time >= self.period_end:
+            # Tick of the next period, ahead of the timer
+            candle = self.close(time)
+        new_candle = super().update(time, open, high, low, close)
+        if self.since is None and self.held is None and self.cache.count:
+            self.since = self.cache.start
+        return candle if candle is not None else new_candle
+
+    def close(self, now):
+        # Returns the candle if the period in progress has ended by now, else None
+        if self.held is not None or self.period_end is None or now < self.period_end:
+            return None
+        candle = self._update_candles()
+        self.cache.reset()
+        self.period_end = None
+        return candle
+
+    def _ends_period(self, time):
+        # Periods are ended by close()
+        return False
+
+    def _update_candles(self):
+        if self.period_start < self.since:
+            # First period, started after its boundary
+            self.logger.info('Not enough data for a candle')
+            return None
+        _pd = self._calc_new_candle()
+        _pd['time'] = self.period_end - self.rt_bar_period
+        self.candles.append(**_pd)
+        return _pd
+
+
+class BarEngine:
+    """
+        Fans one real-time bar stream out to HA candles of many bar periods
+
+        One engine per contract: each distinct period gets a single
+        HACandleBuilder, whatever the number of listeners on it, so a
+        contract costs one subscription and one aggregation pass per period.
+        Listeners are called as listener(period, candle) on candle close.
+        update() and warm_up() are serialized with a lock, and listeners run
+        under it: the bars may be fed by one app's thread while another app
+        warms its period up from its own.
+
+        Arguments
+        ---------
+        rt_bar_period (int): period of the real-time bars fed to update()
+        capacity (int):      candles kept in memory per period, see CandleStore
+        spill_dir (str):     directory of the per period spill files,
+            <name>_<period>s.candles. None to keep no history beyond capacity
+        name (str):          spill file name prefix, normally the symbol
+        calendar (TradingCalendar): where periods are anchored. Local midnight if None
+    """
+
+    BUILDER = HACandleBuilder
+
+    def __init__(self, rt_bar_period=5, capacity=10000, spill_dir=None, name='candles', calendar=None):
+        self.rt_bar_period = rt_bar_period
+        self.calendar = calendar
+        self.capacity = capacity
+        self.spill_dir = spill_dir
+        self.name = name
+        self.builders = {} # period -> HACandleBuilder
+        self.listeners = {} # period -> [listener, ..]
+        self.lock = threading.Lock()
+
+    def add_period(self, period, listener=None, use_prev_ha=True):
+        if period not in self.builders:
+            spill_path = None
+            if self.spill_dir:
+                spill_path = os.path.join(self.spill_dir, f'{self.name}_{period}s.candles')
+            self.builders[period] = self.BUILDER(
+                period, self.rt_bar_period, use_prev_ha, self.capacity, spill_path, self.calendar)
+            self.listeners[period] = []
+        if listener is not None:
+            self.listeners[period].append(listener)
+        return self.builders[period]
+
+    def hold(self, period):
+        # See HACandleBuilder.hold()
+        with self.lock:
+            self.builders[period].hold()
+
+    def warm_up(self, period, time, open, high, low, close, bar_size):
+        # See HACandleBuilder.warm_up(). Listeners get the live candles it completes
+        with self.lock:
+            for candle in self.builders[period].warm_up(time, open, high, low, close, bar_size):
+                for listener in tuple(self.listeners[period]):
+                    listener(period, candle)
+
+    def remove_listener(self, period, listener):
+        if listener in self.listeners.get(period, ()):
+            self.listeners[period].remove(listener)
+
+    def update(self, time, open, high, low, close):
+        # Copies, since apps may (un)register from other threads
+        with self.lock:
+            for period, builder in list(self.builders.items()):
+                candle = builder.update(time, open, high, low, close)
+                if candle is not None:
+                    for listener in tuple(self.listeners[period]):
+                        listener(period, candle)
+
+
+class TickBarEngine(BarEngine):
+    """
+        BarEngine fed with ticks, whose candles close on a wall-clock timer
+
+        The timer thread started by start() wakes up at every period
+        boundary and closes the candles that ended there, so signals fire at
+        the boundary instead of up to a real-time bar later. Closes are
+        serialized with the updates by the engine lock, and listeners run
+        under it, on either the timer or the feeding thread.
+    """
+
+    BUILDER = TickCandleBuilder
+
+    def __init__(self, rt_bar_period=5, capacity=10000, spill_dir=None, name='candles', calendar=None):
+        super().__init__(rt_bar_period, capacity, spill_dir, name, calendar)
+        self.stopped = threading.Event()
+        self.timer = None
+
+    def tick(self, time, price):
+        self.update(time, price, price, price, price)
+
+    def close(self, now):
+        with self.lock:
+            for period, builder in list(self.builders.items()):
+                candle = builder.close(now)
+                if candle is not None:
+                    for listener in tuple(self.listeners[period]):
+                        listener(period, candle)
+
+    def start(self):
+        if self.timer is None:
+            self.timer = threading.Thread(target=self._run_timer, name='TickBarEngine', daemon=True)
+            self.timer.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _run_timer(self):
+        while not self.stopped.is_set():
+            now = _time.time()
+            wake = min((builder.schedule.next_boundary(now) for builder in list(self.builders.values())),
+                       default=now + 1)
+            if self.stopped.wait(max(0.0, wake - _time.time())):
+                break
+            self.close(_time.time())
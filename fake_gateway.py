@@ -0,0 +1,166 @@
+#!/usr/local/bin/python3
+
+import argparse
+import socket
+import struct
+import selectors
+import time as _time
+import multiprocessing
+
+from ibapi import comm
+from ibapi.message import IN
+
+
+class FakeGateway:
+    """
+        Minimal local stand-in for TWS/IB Gateway, for the benchmarks
+
+        Accepts API connections on one thread with a selector, answers the
+        handshake, and ignores whatever the clients send after it. stream()
+        then sends TICK_PRICE msgs to every connected client, the price
+        being the time.monotonic() of the send, so a client can measure the
+        latency of each msg as monotonic() - price. monotonic() is system
+        wide on Linux, so this holds across processes.
+
+        Arguments
+        ---------
+        port (int):           port to listen on. A free one if 0, see self.port
+        server_version (int): server version sent in the handshake
+    """
+
+    def __init__(self, port=0, server_version=151):
+        self.server_version = server_version
+        self.listener = socket.socket()
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', port))
+        self.listener.listen(1024)
+        self.listener.setblocking(False)
+        self.port = self.listener.getsockname()[1]
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.pending = {} # sock -> bytes received before the end of the handshake
+        self.clients = [] # socks done with the handshake
+
+    def poll(self, timeout=0.0):
+        # Accept connections and answer handshakes
+        for (key, _) in self.selector.select(timeout):
+            sock = key.fileobj
+            if sock is self.listener:
+                conn, _ = sock.accept()
+                conn.setblocking(False)
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.pending[conn] = b''
+                self.selector.register(conn, selectors.EVENT_READ)
+                continue
+            try:
+                data = sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                continue
+            except OSError:
+                data = b''
+            if not data:
+                self.drop(sock)
+                continue
+            if sock in self.pending:
+                self._handshake(sock, self.pending[sock] + data)
+
+    def _handshake(self, sock, data):
+        # "API\0" then the length prefixed client version range
+        if len(data) < 8 or len(data) < 8 + struct.unpack('!I', data[4:8])[0]:
+            self.pending[sock] = data
+            return
+        del self.pending[sock]
+        sock.setblocking(True)
+        sock.sendall(comm.make_msg(f'{self.server_version}\0{_time.strftime("%Y%m%d %H:%M:%S")} EST\0'))
+        self.clients.append(sock)
+
+    def wait_clients(self, n, timeout=60.0):
+        deadline = _time.monotonic() + timeout
+        while len(self.clients) < n and _time.monotonic() < deadline:
+            self.poll(0.05)
+        return len(self.clients)
+
+    def drop(self, sock, reset=False):
+        # Close a client. With reset, as an RST rather than a FIN
+        if reset:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+        self.pending.pop(sock, None)
+        if sock in self.clients:
+            self.clients.remove(sock)
+        sock.close()
+
+    @staticmethod
+    def tick_msg(req_id, price, tick_type=4):
+        return comm.make_msg(f'{IN.TICK_PRICE}\0{3}\0{req_id}\0{tick_type}\0{price!r}\0{1}\0{0}\0')
+
+    def stream(self, rate, duration, req_id=1):
+        """
+            Send rate TICK_PRICE msgs a sec to each client, for duration secs
+
+            Returns the number of msgs sent
+        """
+        sent = 0
+        interval = 1.0/rate
+        t_end = _time.monotonic() + duration
+        t_next = _time.monotonic()
+        while t_next < t_end:
+            self.poll(max(0.0, t_next - _time.monotonic()))
+            if _time.monotonic() < t_next:
+                continue
+            for sock in list(self.clients):
+                try:
+                    sock.sendall(FakeGateway.tick_msg(req_id, _time.monotonic()))
+                    sent += 1
+                except OSError:
+                    self.drop(sock)
+            t_next += interval
+        return sent
+
+    def close(self):
+        for sock in list(self.pending) + list(self.clients):
+            self.drop(sock)
+        self.selector.close()
+        self.listener.close()
+
+
+def serve(port, n_clients, rate, duration, ready=None, server_version=151):
+    """
+        Run a FakeGateway: wait for n_clients, stream to them for duration
+        secs at rate msgs/sec each, then close them all
+
+        ready, a multiprocessing Queue, gets the port once it listens. Meant
+        to run in its own process, so its CPU use is not the client's
+    """
+    gateway = FakeGateway(port, server_version)
+    if ready is not None:
+        ready.put(gateway.port)
+    gateway.wait_clients(n_clients)
+    sent = gateway.stream(rate, duration)
+    gateway.close()
+    return sent
+
+
+def start(n_clients, rate, duration, port=0):
+    # serve() in a child process. Returns (the process, its port) once it listens
+    ctx = multiprocessing.get_context('spawn')
+    ready = ctx.Queue()
+    process = ctx.Process(target=serve, args=(port, n_clients, rate, duration, ready), daemon=True)
+    process.start()
+    return process, ready.get()
+
+
+def parse_args():
+    argp = argparse.ArgumentParser()
+    argp.add_argument("-p", "--port", type=int, default=4002, help="Port to listen on")
+    argp.add_argument("-n", "--clients", type=int, default=1, help="Clients to wait for before streaming")
+    argp.add_argument("-r", "--rate", type=float, default=10.0, help="TICK_PRICE msgs per sec to each client")
+    argp.add_argument("-d", "--duration", type=float, default=60.0, help="Secs to stream for")
+    return argp.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    serve(args.port, args.clients, args.rate, args.duration)
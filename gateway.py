@@ -0,0 +1,250 @@
+import time
+import random
+import logging
+import threading
+
+from ibapi.client import EClient
+from ibapi.wrapper import EWrapper
+
+from candles import BarEngine
+
+
+class SharedGateway(EClient, EWrapper):
+    """
+        One IB connection shared by many per-symbol apps
+
+        The apps attach() to the gateway instead of connecting themselves.
+        Their requests go out on the gateway's socket, and the gateway's
+        single EReader/run() thread routes the callbacks back to them by
+        reqId or orderId. As all orders go out on the one clientId, whose
+        order IDs IB wants increasing, the apps take them from newOrderId().
+
+        Arguments
+        ---------
+        port (int):      local port of TWS/Gateway
+        client_id (int): clientId of the shared connection. Random if None
+        msg_interest (iterable): IN.* msg ids the apps handle, see EClient.setMsgInterest()
+    """
+
+    REQ_ID_START = 1000000 # Keep reqIds clear of the order IDs, error() may get either
+
+    def __init__(self, port, client_id=None, msg_interest=None):
+        EClient.__init__(self, self, fastDecode=True, batchHistorical=True)
+        self.setMsgInterest(msg_interest)
+        self.port = port
+        self.client_id = client_id if client_id is not None else random.randint(0, 999)
+        self.logger = logging.getLogger(__name__)
+
+        self.apps = []
+        self.reqId2app = {}
+        self.orderId2app = {}
+        self.symbol2app = {}
+        self.engines = {} # contract key -> candles.BarEngine
+        self.reqId2engine = {}
+        self.reqId2events = {}
+        self.reqId2recorder = {}
+        self.next_req_id = SharedGateway.REQ_ID_START
+        self.next_order_id = None # Seeded by nextValidId()
+        self.order_ids_ready = threading.Event()
+        self.route_lock = threading.Lock()
+
+        self._connect()
+
+    def _connect(self):
+        self.connect("127.0.0.1", self.port, self.client_id)
+        while not self.isConnected():
+            self.logger.info(f'Connecting to IB.. gateway, {self.client_id}')
+            time.sleep(0.5)
+        self.logger.info(f'Connected - gateway, {self.client_id}')
+
+    def _run(self):
+        self.run()
+
+    def attach(self, app):
+        # Point app's EClient side at the shared connection
+        app.conn = self.conn
+        app.clientId = self.clientId
+        app.connTime = self.connTime
+        app.serverVersion_ = self.serverVersion_
+        app.setConnState(EClient.CONNECTED)
+        with self.route_lock:
+            if app not in self.apps:
+                self.apps.append(app)
+            self.symbol2app[app.contract.symbol] = app
+
+    def detach(self, app):
+        with self.route_lock:
+            if app in self.apps:
+                self.apps.remove(app)
+            for routes in (self.reqId2app, self.orderId2app, self.symbol2app):
+                for k in [k for k, v in routes.items() if v is app]:
+                    del routes[k]
+        app.conn = None
+        app.setConnState(EClient.DISCONNECTED)
+
+    def newReqId(self, app):
+        with self.route_lock:
+            req_id = self.next_req_id
+            self.next_req_id += 1
+            self.reqId2app[req_id] = app
+        return req_id
+
+    def bar_engine(self, contract, rt_bar_period, data_type, capacity=10000, spill_dir=None, calendar=None,
+                   events=None, recorder=None):
+        # Per contract BarEngine, subscribed to real-time bars on first use.
+        # The bars are recorded to events, a journal.EventJournal, and
+        # recorder, a journal.TickRecorder, if given
+        key = (contract.symbol, contract.secType, contract.exchange, contract.currency, data_type)
+        with self.route_lock:
+            engine = self.engines.get(key)
+            if engine is not None:
+                return engine
+            engine = self.engines[key] = BarEngine(rt_bar_period, capacity, spill_dir, contract.symbol, calendar)
+            req_id = self.next_req_id
+            self.next_req_id += 1
+            self.reqId2engine[req_id] = engine
+            if events is not None:
+                self.reqId2events[req_id] = events
+            if recorder is not None:
+                self.reqId2recorder[req_id] = recorder
+        self.reqRealTimeBars(req_id, contract, rt_bar_period, data_type, False, [])
+        return engine
+
+    def newOrderId(self, app, timeout=5.0):
+        # Next order ID of the shared clientId, for all apps from one counter,
+        # with the order's callbacks routed to app
+        if not self.order_ids_ready.wait(timeout):
+            raise RuntimeError(f'gateway, no order ID from IB (nextValidId) after {timeout}s')
+        with self.route_lock:
+            order_id = self.next_order_id
+            self.next_order_id += 1
+            self.orderId2app[order_id] = app
+        return order_id
+
+    def _by_req(self, reqId):
+        return self.reqId2app.get(reqId)
+
+    def _by_order(self, orderId):
+        return self.orderId2app.get(orderId)
+
+    def _all(self):
+        with self.route_lock:
+            return list(self.apps)
+
+    # Routed EWrapper callbacks
+    def error(self, reqId, errorCode, errorString):
+        app = self._by_req(reqId) or self._by_order(reqId)
+        if app is not None:
+            app.error(reqId, errorCode, errorString)
+        else:
+            self.logger.warning(f'gateway, {reqId}, {errorCode}, {errorString}')
+
+    def tickPrice(self, reqId, tickType, price, attrib):
+        app = self._by_req(reqId)
+        if app is not None:
+            app.tickPrice(reqId, tickType, price, attrib)
+
+    def tickSize(self, reqId, tickType, size):
+        app = self._by_req(reqId)
+        if app is not None:
+            app.tickSize(reqId, tickType, size)
+
+    def tickString(self, reqId, tickType, value):
+        app = self._by_req(reqId)
+        if app is not None:
+            app.tickString(reqId, tickType, value)
+
+    def tickGeneric(self, reqId, tickType, value):
+        app = self._by_req(reqId)
+        if app is not None:
+            app.tickGeneric(reqId, tickType, value)
+
+    def tickByTickAllLast(self, reqId, tickType, time, price, size, tickAttribLast, exchange, specialConditions):
+        app = self._by_req(reqId)
+        if app is not None:
+            app.tickByTickAllLast(reqId, tickType, time, price, size, tickAttribLast, exchange, specialConditions)
+
+    def tickByTickBidAsk(self, reqId, time, bidPrice, askPrice, bidSize, askSize, tickAttribBidAsk):
+        app = self._by_req(reqId)
+        if app is not None:
+            app.tickByTickBidAsk(reqId, time, bidPrice, askPrice, bidSize, askSize, tickAttribBidAsk)
+
+    def tickByTickMidPoint(self, reqId, time, midPoint):
+        app = self._by_req(reqId)
+        if app is not None:
+            app.tickByTickMidPoint(reqId, time, midPoint)
+
+    def realtimeBar(self, reqId, time, open_, high, low, close, volume, wap, count):
+        engine = self.reqId2engine.get(reqId)
+        if engine is not None:
+            events = self.reqId2events.get(reqId)
+            if events is not None:
+                events.append(events.BAR, time, size=volume, open=open_, high=high, low=low, close=close)
+            recorder = self.reqId2recorder.get(reqId)
+            if recorder is not None:
+                recorder.bar(time, open_, high, low, close, volume, wap, count)
+            engine.update(time, open_, high, low, close)
+            return
+        app = self._by_req(reqId)
+        if app is not None:
+            app.realtimeBar(reqId, time, open_, high, low, close, volume, wap, count)
+
+    def historicalData(self, reqId, bar):
+        app = self._by_req(reqId)
+        if app is not None:
+            app.historicalData(reqId, bar)
+
+    def historicalDataBatch(self, reqId, arrays):
+        app = self._by_req(reqId)
+        if app is not None:
+            app.historicalDataBatch(reqId, arrays)
+
+    def historicalDataEnd(self, reqId, start, end):
+        app = self._by_req(reqId)
+        if app is not None:
+            app.historicalDataEnd(reqId, start, end)
+
+    def historicalDataUpdate(self, reqId, bar):
+        app = self._by_req(reqId)
+        if app is not None:
+            app.historicalDataUpdate(reqId, bar)
+
+    def orderStatus(
+            self, orderId, status, filled, remaining, avgFullPrice,
+            permId, parentId, lastFillPrice, clientId, whyHeld, mktCapPrice):
+        app = self._by_order(orderId)
+        if app is not None:
+            app.orderStatus(
+                orderId, status, filled, remaining, avgFullPrice,
+                permId, parentId, lastFillPrice, clientId, whyHeld, mktCapPrice)
+
+    def openOrder(self, orderId, contract, order, orderState):
+        # Orders left over from a previous session are only known by symbol
+        app = self._by_order(orderId) or self.symbol2app.get(contract.symbol)
+        if app is not None:
+            app.openOrder(orderId, contract, order, orderState)
+
+    def openOrderEnd(self):
+        for app in self._all():
+            app.openOrderEnd()
+
+    def execDetails(self, reqId, contract, execution):
+        app = self._by_order(execution.orderId) or self.symbol2app.get(contract.symbol)
+        if app is not None:
+            app.execDetails(reqId, contract, execution)
+
+    def nextValidId(self, orderId):
+        super().nextValidId(orderId)
+        with self.route_lock:
+            # Sent at connect and for reqIds(). Never go back to an ID already used
+            if self.next_order_id is None or orderId > self.next_order_id:
+                self.next_order_id = orderId
+        self.order_ids_ready.set()
+        for app in self._all():
+            app.nextValidId(orderId)
+
+    def connectionClosed(self):
+        super().connectionClosed()
+        for app in self._all():
+            app.setConnState(EClient.DISCONNECTED)
+            app.connectionClosed()
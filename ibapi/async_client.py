@@ -0,0 +1,235 @@
+"""
+Copyright (C) 2019 Interactive Brokers LLC. All rights reserved. This code is subject to the terms
+ and conditions of the IB API Non-Commercial License or the IB API Commercial License, as applicable.
+"""
+
+
+"""
+EClient flavour that runs entirely on an asyncio event loop.
+There is no EReader thread and no msg Queue: the socket is read with a
+BufferedProtocol straight into a comm.FrameBuffer, and framing, decoding
+and the EWrapper callbacks all happen on the loop as the bytes arrive.
+Any number of clients can share one loop (and thus one thread).
+"""
+
+import asyncio
+import logging
+
+from ibapi import (decoder, comm, utils)
+from ibapi.client import EClient
+from ibapi.common import * # @UnusedWildImport
+from ibapi.utils import BadMessage
+from ibapi.errors import * #@UnusedWildImport
+from ibapi.server_versions import * # @UnusedWildImport
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncConnection(asyncio.BufferedProtocol):
+    """ Protocol standing in for connection.Connection on an event loop """
+
+    def __init__(self, client):
+        self.client = client
+        self.loop = client.loop
+        self.transport = None
+        self.buf = comm.FrameBuffer()
+        self.handshake = self.loop.create_future()
+        self.closed = self.loop.create_future()
+        self.exc = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        logger.debug("connection lost %s", exc)
+        self.transport = None
+        if not self.handshake.done():
+            self.handshake.set_exception(exc or ConnectionError())
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+    def get_buffer(self, sizehint):
+        return self.buf.writable(self.client.recvSize)
+
+    def buffer_updated(self, nbytes):
+        self.buf.commit(nbytes)
+        try:
+            for (size, msg) in self.buf.frames():
+                if size > MAX_MSG_LEN:
+                    self.client.wrapper.error(NO_VALID_ID, BAD_LENGTH.code(),
+                        "%s:%d:%s" % (BAD_LENGTH.msg(), size, bytes(msg)))
+                    self.disconnect()
+                    return
+                text = bytes(msg)
+                if utils.WIRE_TRACE_EVERY:
+                    self.client.traceMsg(text)
+                if self.handshake.done() and not self.client.wantsMsg(text):
+                    continue
+                fields = comm.read_fields(text)
+                if utils.HOT_PATH_LOGGING:
+                    logger.debug("fields %s", fields)
+                if not self.handshake.done() and len(fields) == 2:
+                    # (server_version, conn_time). Frames after it in this
+                    # same read are decoded below, before connectAsync()
+                    # resumes, so the decoder needs the version now
+                    (server_version, conn_time) = fields
+                    self.client.setServerVersion(int(server_version), conn_time)
+                    self.handshake.set_result(fields)
+                else:
+                    #sometimes I get news before the server version
+                    self.client.decoder.interpret(fields)
+        except BadMessage:
+            logger.info("BadMessage")
+            self.disconnect()
+        except BaseException as exc:
+            # re-raised from runAsync(), just like EClient.run() would
+            self.exc = exc
+            self.disconnect()
+
+    def eof_received(self):
+        return False
+
+    def isConnected(self):
+        return self.transport is not None
+
+    def sendMsg(self, msg):
+        if not self.isConnected():
+            logger.debug("sendMsg attempted while not connected")
+            return 0
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not self.loop and self.loop.is_running():
+            # asyncio transports are not thread safe
+            self.loop.call_soon_threadsafe(self._write, msg)
+        else:
+            self._write(msg)
+        return len(msg)
+
+    def _write(self, msg):
+        if self.transport is not None:
+            self.transport.write(msg)
+
+    def disconnect(self):
+        if self.transport is not None:
+            logger.debug("disconnecting")
+            self.transport.close()
+            self.transport = None
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+
+class AsyncEClient(EClient):
+    """ EClient that needs no reader thread
+
+    Use connectAsync()/runAsync() from a coroutine to share one loop
+    between many clients. connect()/run() keep the blocking EClient
+    interface by driving the loop themselves, so an existing EClient
+    subclass can be moved over by putting AsyncEClient first in its bases.
+    """
+
+    loop = None
+
+    def reset(self):
+        super().reset()
+        self.asynchronous = True
+
+    def getLoop(self):
+        if self.loop is None:
+            try:
+                self.loop = asyncio.get_running_loop()
+            except RuntimeError:
+                try:
+                    self.loop = asyncio.get_event_loop_policy().get_event_loop()
+                except RuntimeError:
+                    # worker thread with no loop of its own yet
+                    self.loop = asyncio.new_event_loop()
+                    asyncio.set_event_loop(self.loop)
+        return self.loop
+
+
+    async def connectAsync(self, host, port, clientId):
+        """Coroutine version of EClient.connect()"""
+
+        try:
+            self.host = host
+            self.port = port
+            self.clientId = clientId
+            logger.debug("Connecting to %s:%d w/ id:%d", self.host, self.port, self.clientId)
+
+            self.decoder = decoder.Decoder(self.wrapper, self.serverVersion(),
+                                           self.fastDecode, self.batchHistorical)
+            (_, self.conn) = await self.getLoop().create_connection(
+                lambda: AsyncConnection(self), self.host, self.port)
+            self.setConnState(EClient.CONNECTING)
+
+            v100prefix = "API\0"
+            v100version = "v%d..%d" % (MIN_CLIENT_VER, MAX_CLIENT_VER)
+            msg = comm.make_msg(v100version)
+            msg2 = str.encode(v100prefix, 'ascii') + msg
+            logger.debug("REQUEST %s", msg2)
+            self.conn.sendMsg(msg2)
+
+            await self.conn.handshake
+            if not self.conn.isConnected():
+                # lost while decoding what came along with the handshake
+                raise ConnectionError("connection lost during setup")
+
+            self.setConnState(EClient.CONNECTED)
+
+            logger.info("sent startApi")
+            self.startApi()
+            self.wrapper.connectAck()
+        except OSError:
+            if self.wrapper:
+                self.wrapper.error(NO_VALID_ID, CONNECT_FAIL.code(), CONNECT_FAIL.msg())
+            logger.info("could not connect")
+            self.disconnect()
+            self.done = True
+            # unlike EClient.connect(), so that callers do not wait on a
+            # connection that will never come up
+            raise
+
+
+    def setServerVersion(self, server_version, conn_time):
+        """Handshake answer, see AsyncConnection.buffer_updated()"""
+
+        logger.debug("ANSWER Version:%d time:%s", server_version, conn_time)
+        self.connTime = conn_time
+        self.serverVersion_ = server_version
+        self.decoder.serverVersion = self.serverVersion()
+
+
+    def connect(self, host, port, clientId):
+        """Blocking connect, see EClient.connect(). Must not be called from
+        a running loop, await connectAsync() there instead."""
+
+        self.getLoop().run_until_complete(
+            self.connectAsync(host, port, clientId))
+
+
+    async def runAsync(self):
+        """Coroutine version of EClient.run(): completes once the
+        connection is closed. The messages themselves are dispatched by
+        the protocol as they come in."""
+
+        try:
+            conn = self.conn
+            if not self.done and conn is not None:
+                await conn.closed
+                if conn.exc is not None:
+                    raise conn.exc
+        finally:
+            self.disconnect()
+
+
+    def run(self):
+        """This is the function that has the message loop."""
+
+        try:
+            self.getLoop().run_until_complete(self.runAsync())
+        except (KeyboardInterrupt, SystemExit):
+            logger.info("detected KeyboardInterrupt, SystemExit")
+            self.keyboardInterrupt()
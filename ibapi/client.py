@@ -17,10 +17,11 @@ The user just needs to override EWrapper methods to receive the answers.
 import logging
 import queue
 import socket
+import collections
 
-from ibapi import (decoder, reader, comm)
+from ibapi import (decoder, reader, comm, utils)
 from ibapi.connection import Connection
-from ibapi.message import OUT
+from ibapi.message import (IN, OUT)
 from ibapi.common import * # @UnusedWildImport
 from ibapi.contract import Contract
 from ibapi.order import Order
@@ -41,9 +42,17 @@ class EClient(object):
 
     #TODO: support redirect !!
 
-    def __init__(self, wrapper):
+    def __init__(self, wrapper, recvSize=64 * 1024, selectorReader=None,
+                 fastDecode=False, batchHistorical=False):
         self.msg_queue = queue.Queue()
         self.wrapper = wrapper
+        self.recvSize = recvSize
+        self.selectorReader = selectorReader
+        self.fastDecode = fastDecode   # see Decoder.msgId2fastMeth
+        self.batchHistorical = batchHistorical   # see Decoder.msgId2batchMeth
+        self.msgInterest = None
+        self.droppedMsgs = collections.Counter()
+        self.nMsgsRecvd = 0   # only counted while the wire trace is on
         self.decoder = None
         self.reset()
 
@@ -78,6 +87,35 @@ class EClient(object):
         self.conn.sendMsg(full_msg)
 
 
+    def setMsgInterest(self, msgIds):
+        """Only the msgs whose IN.* id is in msgIds get decoded and passed on
+        to the wrapper, the others are dropped as soon as their id is known
+        and counted per id in self.droppedMsgs. ERR_MSG is always kept.
+        None (the default) decodes everything."""
+
+        if msgIds is None:
+            self.msgInterest = None
+        else:
+            self.msgInterest = frozenset(msgIds) | {IN.ERR_MSG}
+
+
+    def wantsMsg(self, text):
+        if self.msgInterest is None:
+            return True
+        msgId = comm.read_msg_id(text)
+        if msgId in self.msgInterest:
+            return True
+        self.droppedMsgs[msgId] += 1
+        return False
+
+
+    def traceMsg(self, text):
+        """ sampled raw msg trace, see utils.WIRE_TRACE_EVERY """
+        self.nMsgsRecvd += 1
+        if self.nMsgsRecvd % utils.WIRE_TRACE_EVERY == 0:
+            utils.wireLogger.debug("%s #%d %s", id(self), self.nMsgsRecvd, text)
+
+
     def logRequest(self, fnName, fnParams):
         if logger.isEnabledFor(logging.INFO):
             if 'self' in fnParams:
@@ -132,7 +170,7 @@ class EClient(object):
             self.clientId = clientId
             logger.debug("Connecting to %s:%d w/ id:%d", self.host, self.port, self.clientId)
 
-            self.conn = Connection(self.host, self.port)
+            self.conn = Connection(self.host, self.port, self.recvSize)
 
             self.conn.connect()
             self.setConnState(EClient.CONNECTING)
@@ -148,7 +186,8 @@ class EClient(object):
             logger.debug("REQUEST %s", msg2)
             self.conn.sendMsg(msg2)
 
-            self.decoder = decoder.Decoder(self.wrapper, self.serverVersion())
+            self.decoder = decoder.Decoder(self.wrapper, self.serverVersion(),
+                                           self.fastDecode, self.batchHistorical)
             fields = []
 
             #sometimes I get news before the server version, thus the loop
@@ -173,8 +212,13 @@ class EClient(object):
 
             self.setConnState(EClient.CONNECTED)
 
-            self.reader = reader.EReader(self.conn, self.msg_queue)
-            self.reader.start()   # start thread
+            if self.selectorReader is not None:
+                # shared reader thread, see reader.ESelectorReader
+                self.reader = self.selectorReader
+                self.reader.register(self.conn, self.msg_queue)
+            else:
+                self.reader = reader.EReader(self.conn, self.msg_queue)
+                self.reader.start()   # start thread
             logger.info("sent startApi")
             self.startApi()
             self.wrapper.connectAck()
@@ -203,8 +247,9 @@ class EClient(object):
         """Call this function to check if there is a connection with TWS"""
 
         connConnected = self.conn and self.conn.isConnected()
-        logger.debug("%s isConn: %s, connConnected: %s" % (id(self),
-            self.connState, str(connConnected)))
+        if utils.HOT_PATH_LOGGING:
+            logger.debug("%s isConn: %s, connConnected: %s" % (id(self),
+                self.connState, str(connConnected)))
         return EClient.CONNECTED == self.connState and connConnected
 
     def keyboardInterrupt(self):
@@ -232,10 +277,16 @@ class EClient(object):
                             self.disconnect()
                             break
                     except queue.Empty:
-                        logger.debug("queue.get: empty")
+                        if utils.HOT_PATH_LOGGING:
+                            logger.debug("queue.get: empty")
                     else:
+                        if utils.WIRE_TRACE_EVERY:
+                            self.traceMsg(text)
+                        if not self.wantsMsg(text):
+                            continue
                         fields = comm.read_fields(text)
-                        logger.debug("fields %s", fields)
+                        if utils.HOT_PATH_LOGGING:
+                            logger.debug("fields %s", fields)
                         self.decoder.interpret(fields)
                 except (KeyboardInterrupt, SystemExit):
                     logger.info("detected KeyboardInterrupt, SystemExit")
@@ -245,9 +296,10 @@ class EClient(object):
                     logger.info("BadMessage")
                     self.conn.disconnect()
 
-                logger.debug("conn:%d queue.sz:%d",
-                             self.isConnected(),
-                             self.msg_queue.qsize())
+                if utils.HOT_PATH_LOGGING:
+                    logger.debug("conn:%d queue.sz:%d",
+                                 self.isConnected(),
+                                 self.msg_queue.qsize())
         finally:
             self.disconnect()
 
@@ -12,6 +12,7 @@ This module has tools for implementing the IB low level messaging.
 import struct
 import logging
 
+from ibapi import utils
 from ibapi.common import UNSET_INTEGER, UNSET_DOUBLE
 
 logger = logging.getLogger(__name__)
@@ -53,7 +54,8 @@ def read_msg(buf:bytes) -> tuple:
     if len(buf) < 4:
         return (0, "", buf)
     size = struct.unpack("!I", buf[0:4])[0]
-    logger.debug("read_msg: size: %d", size)
+    if utils.HOT_PATH_LOGGING:
+        logger.debug("read_msg: size: %d", size)
     if len(buf) - 4 >= size:
         text = struct.unpack("!%ds" % size, buf[4:4+size])[0]
         return (size, text, buf[4+size:])
@@ -61,6 +63,11 @@ def read_msg(buf:bytes) -> tuple:
         return (size, "", buf)
 
 
+def read_msg_id(buf:bytes) -> int:
+    """ peeks at the msg id (first field) without splitting the payload """
+    return int(buf[:buf.find(b"\0")])
+
+
 def read_fields(buf:bytes) -> tuple:
 
     if isinstance(buf, str):
@@ -73,3 +80,68 @@ def read_fields(buf:bytes) -> tuple:
 
 
 
+class FrameBuffer:
+    """ growable receive buffer that frames the length prefixed msgs in place
+
+    Incoming bytes are appended at the write cursor and complete msgs are
+    handed out as memoryview slices starting at the read cursor, so framing
+    a burst of N msgs costs O(N) instead of re-copying the backlog after
+    every msg. The views are only valid until the next write(), callers that
+    keep a msg around (eg: put it on a Queue) must take a copy with bytes().
+    """
+
+    def __init__(self, size=64 * 1024):
+        self.buf = bytearray(size)
+        self.rpos = 0
+        self.wpos = 0
+
+    def __len__(self):
+        return self.wpos - self.rpos
+
+    def reserve(self, n):
+        """ makes room for at least n more bytes after the write cursor """
+        if len(self.buf) - self.wpos >= n:
+            return
+        pending = self.wpos - self.rpos
+        size = len(self.buf)
+        while size - pending < n:
+            size *= 2
+        if size == len(self.buf):
+            # only the trailing partial msg (if any) is left to move
+            self.buf[:pending] = self.buf[self.rpos:self.wpos]
+        else:
+            # views handed out earlier may still pin the old buffer, so
+            # grow into a new one rather than resizing in place
+            buf = bytearray(size)
+            buf[:pending] = self.buf[self.rpos:self.wpos]
+            self.buf = buf
+        self.rpos = 0
+        self.wpos = pending
+
+    def write(self, data):
+        n = len(data)
+        self.reserve(n)
+        self.buf[self.wpos:self.wpos + n] = data
+        self.wpos += n
+
+    def writable(self, n):
+        """ returns a view of at least n free bytes, to be filled by
+        recv_into() and then committed with commit() """
+        self.reserve(n)
+        return memoryview(self.buf)[self.wpos:]
+
+    def commit(self, n):
+        self.wpos += n
+
+    def frames(self):
+        """ yields (size, msg) for every complete msg, msg is a memoryview """
+        view = memoryview(self.buf)
+        while self.wpos - self.rpos >= 4:
+            (size, ) = struct.unpack_from("!I", self.buf, self.rpos)
+            start = self.rpos + 4
+            if self.wpos - start < size:
+                break
+            self.rpos = start + size
+            yield (size, view[start:self.rpos])
+        if self.rpos == self.wpos:
+            self.rpos = self.wpos = 0
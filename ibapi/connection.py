@@ -14,6 +14,7 @@ import socket
 import threading
 import logging
 
+from ibapi import utils
 from ibapi.common import * # @UnusedWildImport
 from ibapi.errors import * # @UnusedWildImport
 
@@ -24,9 +25,10 @@ logger = logging.getLogger(__name__)
 
 
 class Connection:
-    def __init__(self, host, port):
+    def __init__(self, host, port, recvSize=64 * 1024):
         self.host = host
         self.port = port
+        self.recvSize = recvSize   # max bytes read per recv_into() call
         self.socket = None
         self.wrapper = None
         self.lock = threading.Lock()
@@ -69,9 +71,12 @@ class Connection:
 
     def sendMsg(self, msg):
 
-        logger.debug("acquiring lock")
+        hotLog = utils.HOT_PATH_LOGGING
+        if hotLog:
+            logger.debug("acquiring lock")
         self.lock.acquire()
-        logger.debug("acquired lock")
+        if hotLog:
+            logger.debug("acquired lock")
         if not self.isConnected():
             logger.debug("sendMsg attempted while not connected, releasing lock")
             self.lock.release()
@@ -82,11 +87,14 @@ class Connection:
             logger.debug("exception from sendMsg %s", sys.exc_info())
             raise
         finally:
-            logger.debug("releasing lock")
+            if hotLog:
+                logger.debug("releasing lock")
             self.lock.release()
-            logger.debug("release lock")
+            if hotLog:
+                logger.debug("release lock")
 
-        logger.debug("sendMsg: sent: %d", nSent)
+        if hotLog:
+            logger.debug("sendMsg: sent: %d", nSent)
 
         return nSent
 
@@ -103,7 +111,8 @@ class Connection:
                 logger.debug("socket either closed or broken, disconnecting")
                 self.disconnect()
         except socket.timeout:
-            logger.debug("socket timeout from recvMsg %s", sys.exc_info())
+            if utils.HOT_PATH_LOGGING:
+                logger.debug("socket timeout from recvMsg %s", sys.exc_info())
             buf = b""
         else:
             pass
@@ -111,6 +120,50 @@ class Connection:
         return buf
 
 
+    def recvMsgInto(self, buf, drain=True):
+        """ same as recvMsg() but reads straight into buf, a
+        comm.FrameBuffer, and returns the number of bytes received.
+        With drain=False only one recv is done, for callers that already
+        know the socket is readable and must not block on it """
+        if not self.isConnected():
+            logger.debug("recvMsgInto attempted while not connected")
+            return 0
+        try:
+            nRecvd = self._recvAllMsgInto(buf, drain)
+            # receiving 0 bytes outside a timeout means the connection is either
+            # closed or broken
+            if nRecvd == 0:
+                logger.debug("socket either closed or broken, disconnecting")
+                self.disconnect()
+        except socket.timeout:
+            if utils.HOT_PATH_LOGGING:
+                logger.debug("socket timeout from recvMsgInto %s", sys.exc_info())
+            nRecvd = 0
+
+        return nRecvd
+
+
+    def _recvAllMsgInto(self, buf, drain=True):
+        nRecvd = 0
+
+        while True:
+            # a disconnect() from another thread may clear self.socket at
+            # any point, recv on the closed socket then raises OSError
+            sock = self.socket
+            if sock is None:
+                break
+            n = sock.recv_into(buf.writable(self.recvSize), self.recvSize)
+            buf.commit(n)
+            nRecvd += n
+            if utils.HOT_PATH_LOGGING:
+                logger.debug("recv_into len %d", n)
+
+            if n < self.recvSize or not drain:
+                break
+
+        return nRecvd
+
+
     def _recvAllMsg(self):
         cont = True
         allbuf = b""
@@ -118,7 +171,8 @@ class Connection:
         while cont and self.socket is not None:
             buf = self.socket.recv(4096)
             allbuf += buf
-            logger.debug("len %d raw:%s|", len(buf), buf)
+            if utils.HOT_PATH_LOGGING:
+                logger.debug("len %d raw:%s|", len(buf), buf)
 
             if len(buf) < 4096:
                 cont = False
@@ -22,18 +22,52 @@ from ibapi.scanner import ScanData
 from ibapi.errors import BAD_MESSAGE
 from ibapi.common import * # @UnusedWildImport
 from ibapi.orderdecoder import OrderDecoder
+from ibapi import utils
+
+try:
+    import numpy
+except ImportError:
+    # only needed for batchHistorical
+    numpy = None
 
 logger = logging.getLogger(__name__)
 
 
+def decodeText(field):
+    try:
+        return field.decode('UTF-8')
+    except UnicodeDecodeError:
+        return field.decode('latin-1')
+
+
 class HandleInfo(Object):
     def __init__(self, wrap=None, proc=None):
         self.wrapperMeth = wrap
         self.wrapperParams = None
+        self.argConverters = None   # one per wrapper param, see setParams()
+        self.nArgs = None
         self.processMeth = proc
         if wrap is None and proc is None:
             raise ValueError("both wrap and proc can't be None")
 
+    def setParams(self, params):
+        """ keeps the wrapper signature and turns it into a conversion plan
+        once, so interpretWithSignature() does not have to look at the
+        annotations again for every msg """
+        self.wrapperParams = params
+        converters = []
+        for (pname, param) in params.items():
+            if pname == "self":
+                continue
+            if param.annotation is int:
+                converters.append(int)
+            elif param.annotation is float:
+                converters.append(float)
+            else:
+                converters.append(decodeText)
+        self.argConverters = tuple(converters)
+        self.nArgs = len(converters)
+
     def __str__(self):
         s = "wrap:%s meth:%s prms:%s" % (self.wrapperMeth,
                 self.processMeth, self.wrapperParams)
@@ -41,9 +75,14 @@ class HandleInfo(Object):
 
 
 class Decoder(Object):
-    def __init__(self, wrapper, serverVersion):
+    def __init__(self, wrapper, serverVersion, fastDecode=False,
+                 batchHistorical=False):
         self.wrapper = wrapper
         self.serverVersion = serverVersion
+        self.fastDecode = fastDecode
+        if batchHistorical and numpy is None:
+            raise ImportError("batchHistorical requires numpy")
+        self.batchHistorical = batchHistorical
         self.discoverParams()
         #self.printParams()
 
@@ -1196,6 +1235,224 @@ class Decoder(Object):
             if isBond and len(splitted) > 2:
                 contract.timeZoneId = splitted[2]
 
+    ######################################################################
+    # Fast decoders: same msgs as the process*Msg() above, but the fields
+    # tuple is unpacked in one go and converted inline instead of going
+    # through decode() field by field. Used when fastDecode is set.
+
+    def fastTickPriceMsg(self, fields):
+        if len(fields) < 7:
+            raise BadMessage("no more fields")
+        (_, _, reqId, tickType, price, size, attrMask) = fields[:7]
+        reqId = int(reqId or 0)
+        tickType = int(tickType or 0)
+        price = float(price or 0)
+        size = int(size or 0)
+        attrMask = int(attrMask or 0)
+
+        attrib = TickAttrib()
+        attrib.canAutoExecute = attrMask == 1
+        if self.serverVersion >= MIN_SERVER_VER_PAST_LIMIT:
+            attrib.canAutoExecute = attrMask & 1 != 0
+            attrib.pastLimit = attrMask & 2 != 0
+            if self.serverVersion >= MIN_SERVER_VER_PRE_OPEN_BID_ASK:
+                attrib.preOpen = attrMask & 4 != 0
+
+        self.wrapper.tickPrice(reqId, tickType, price, attrib)
+
+        sizeTickType = self.priceTick2sizeTick.get(tickType)
+        if sizeTickType is not None:
+            self.wrapper.tickSize(reqId, sizeTickType, size)
+
+    priceTick2sizeTick = {
+        TickTypeEnum.BID: TickTypeEnum.BID_SIZE,
+        TickTypeEnum.ASK: TickTypeEnum.ASK_SIZE,
+        TickTypeEnum.LAST: TickTypeEnum.LAST_SIZE,
+        TickTypeEnum.DELAYED_BID: TickTypeEnum.DELAYED_BID_SIZE,
+        TickTypeEnum.DELAYED_ASK: TickTypeEnum.DELAYED_ASK_SIZE,
+        TickTypeEnum.DELAYED_LAST: TickTypeEnum.DELAYED_LAST_SIZE,
+    }
+
+    def fastTickSizeMsg(self, fields):
+        if len(fields) != 5:
+            logger.error("diff len fields and params %d %d for fields: %s",
+                         len(fields), 5, fields)
+            return
+        (_, _, reqId, tickType, size) = fields
+        self.wrapper.tickSize(int(reqId), int(tickType), int(size))
+
+    def fastRealTimeBarMsg(self, fields):
+        if len(fields) < 11:
+            raise BadMessage("no more fields")
+        (_, _, reqId, time, open_, high, low, close, volume, wap, count) = fields[:11]
+        self.wrapper.realtimeBar(int(reqId or 0), int(time or 0),
+            float(open_ or 0), float(high or 0), float(low or 0), float(close or 0),
+            int(volume or 0), float(wap or 0), int(count or 0))
+
+    def fastTickByTickMsg(self, fields):
+        if len(fields) < 4:
+            raise BadMessage("no more fields")
+        (_, reqId, tickType, time) = fields[:4]
+        reqId = int(reqId or 0)
+        tickType = int(tickType or 0)
+        time = int(time or 0)
+
+        if tickType == 1 or tickType == 2:
+            # Last or AllLast
+            if len(fields) < 9:
+                raise BadMessage("no more fields")
+            (price, size, mask, exchange, specialConditions) = fields[4:9]
+            mask = int(mask or 0)
+            tickAttribLast = TickAttribLast()
+            tickAttribLast.pastLimit = mask & 1 != 0
+            tickAttribLast.unreported = mask & 2 != 0
+            self.wrapper.tickByTickAllLast(reqId, tickType, time,
+                float(price or 0), int(size or 0), tickAttribLast,
+                exchange.decode(errors='backslashreplace'),
+                specialConditions.decode(errors='backslashreplace'))
+        elif tickType == 3:
+            # BidAsk
+            if len(fields) < 9:
+                raise BadMessage("no more fields")
+            (bidPrice, askPrice, bidSize, askSize, mask) = fields[4:9]
+            mask = int(mask or 0)
+            tickAttribBidAsk = TickAttribBidAsk()
+            tickAttribBidAsk.bidPastLow = mask & 1 != 0
+            tickAttribBidAsk.askPastHigh = mask & 2 != 0
+            self.wrapper.tickByTickBidAsk(reqId, time, float(bidPrice or 0),
+                float(askPrice or 0), int(bidSize or 0), int(askSize or 0),
+                tickAttribBidAsk)
+        elif tickType == 4:
+            # MidPoint
+            if len(fields) < 5:
+                raise BadMessage("no more fields")
+            self.wrapper.tickByTickMidPoint(reqId, time, float(fields[4] or 0))
+
+    def fastMarketDepthL2Msg(self, fields):
+        if len(fields) < 9:
+            raise BadMessage("no more fields")
+        (_, _, reqId, position, marketMaker, operation, side, price, size) = fields[:9]
+        isSmartDepth = False
+        if self.serverVersion >= MIN_SERVER_VER_SMART_DEPTH:
+            if len(fields) < 10:
+                raise BadMessage("no more fields")
+            isSmartDepth = int(fields[9] or 0) != 0
+
+        self.wrapper.updateMktDepthL2(int(reqId or 0), int(position or 0),
+            marketMaker.decode(errors='backslashreplace'), int(operation or 0),
+            int(side or 0), float(price or 0), int(size or 0), isSmartDepth)
+
+    def fastOrderStatusMsg(self, fields):
+        if len(fields) < 12:
+            raise BadMessage("no more fields")
+        # the version field is gone since MIN_SERVER_VER_MARKET_CAP_PRICE
+        if self.serverVersion >= MIN_SERVER_VER_MARKET_CAP_PRICE:
+            (_, orderId, status, filled, remaining, avgFillPrice, permId,
+                parentId, lastFillPrice, clientId, whyHeld, mktCapPrice) = fields[:12]
+            mktCapPrice = float(mktCapPrice or 0)
+        else:
+            (_, _, orderId, status, filled, remaining, avgFillPrice, permId,
+                parentId, lastFillPrice, clientId, whyHeld) = fields[:12]
+            mktCapPrice = None
+
+        if self.serverVersion >= MIN_SERVER_VER_FRACTIONAL_POSITIONS:
+            filled = float(filled or 0)
+            remaining = float(remaining or 0)
+        else:
+            filled = int(filled or 0)
+            remaining = int(remaining or 0)
+
+        self.wrapper.orderStatus(int(orderId or 0),
+            status.decode(errors='backslashreplace'), filled, remaining,
+            float(avgFillPrice or 0), int(permId or 0), int(parentId or 0),
+            float(lastFillPrice or 0), int(clientId or 0),
+            whyHeld.decode(errors='backslashreplace'), mktCapPrice)
+
+    ######################################################################
+    # Batch decoders: whole historical replies are turned into numpy
+    # column arrays and handed over in one callback, instead of one
+    # BarData/HistoricalTick object and one callback per row. Used when
+    # batchHistorical is set.
+
+    def columns(self, fields, start, count, stride, layout):
+        end = start + count * stride
+        arrays = {}
+        for (name, offset, dtype) in layout:
+            col = numpy.array(fields[start + offset:end:stride], dtype=bytes)
+            if dtype is str:
+                arrays[name] = numpy.char.decode(col, errors='backslashreplace')
+            else:
+                arrays[name] = col.astype(dtype)
+        return (arrays, end)
+
+    def batchHistoricalDataMsg(self, fields):
+        idx = 1
+        if self.serverVersion < MIN_SERVER_VER_SYNT_REALTIME_BARS:
+            idx += 1
+        if len(fields) < idx + 4:
+            raise BadMessage("no more fields")
+        reqId = int(fields[idx])
+        startDateStr = fields[idx + 1].decode(errors='backslashreplace')
+        endDateStr = fields[idx + 2].decode(errors='backslashreplace')
+        itemCount = int(fields[idx + 3])
+
+        if self.serverVersion < MIN_SERVER_VER_SYNT_REALTIME_BARS:
+            stride = 9 # extra (unused) hasGaps field before barCount
+        else:
+            stride = 8
+        if len(fields) < idx + 4 + itemCount * stride:
+            raise BadMessage("no more fields")
+        (arrays, _) = self.columns(fields, idx + 4, itemCount, stride, (
+            ("date", 0, str),
+            ("open", 1, numpy.float64),
+            ("high", 2, numpy.float64),
+            ("low", 3, numpy.float64),
+            ("close", 4, numpy.float64),
+            ("volume", 5, numpy.int64),
+            ("wap", 6, numpy.float64),
+            ("count", stride - 1, numpy.int64)))
+
+        self.wrapper.historicalDataBatch(reqId, arrays)
+        self.wrapper.historicalDataEnd(reqId, startDateStr, endDateStr)
+
+    def batchHistoricalTicksMsg(self, fields, layout, stride, wrapperMeth):
+        if len(fields) < 3:
+            raise BadMessage("no more fields")
+        reqId = int(fields[1])
+        tickCount = int(fields[2])
+        if len(fields) < 4 + tickCount * stride:
+            raise BadMessage("no more fields")
+        (arrays, end) = self.columns(fields, 3, tickCount, stride, layout)
+        done = int(fields[end] or 0) != 0
+        wrapperMeth(reqId, arrays, done)
+
+    def batchHistoricalTicks(self, fields):
+        self.batchHistoricalTicksMsg(fields, (
+            ("time", 0, numpy.int64),
+            ("price", 2, numpy.float64),
+            ("size", 3, numpy.int64)),
+            4, self.wrapper.historicalTicksBatch)
+
+    def batchHistoricalTicksBidAsk(self, fields):
+        self.batchHistoricalTicksMsg(fields, (
+            ("time", 0, numpy.int64),
+            ("mask", 1, numpy.int64),
+            ("priceBid", 2, numpy.float64),
+            ("priceAsk", 3, numpy.float64),
+            ("sizeBid", 4, numpy.int64),
+            ("sizeAsk", 5, numpy.int64)),
+            6, self.wrapper.historicalTicksBidAskBatch)
+
+    def batchHistoricalTicksLast(self, fields):
+        self.batchHistoricalTicksMsg(fields, (
+            ("time", 0, numpy.int64),
+            ("mask", 1, numpy.int64),
+            ("price", 2, numpy.float64),
+            ("size", 3, numpy.int64),
+            ("exchange", 4, str),
+            ("specialConditions", 5, str)),
+            6, self.wrapper.historicalTicksLastBatch)
+
     ######################################################################
 
     def discoverParams(self):
@@ -1209,7 +1466,7 @@ class Decoder(Object):
             sig = inspect.signature(meth)
             handleInfo = meth2handleInfo.get(meth, None)
             if handleInfo is not None:
-                handleInfo.wrapperParams = sig.parameters
+                handleInfo.setParams(sig.parameters)
 
             #for (pname, param) in sig.parameters.items():
             #     logger.debug("\tparam %s %s %s", pname, param.name, param.annotation)
@@ -1230,32 +1487,18 @@ class Decoder(Object):
             return
 
         nIgnoreFields = 2 #bypass msgId and versionId faster this way
-        if len(fields) - nIgnoreFields != len(handleInfo.wrapperParams) - 1:
+        if len(fields) - nIgnoreFields != handleInfo.nArgs:
             logger.error("diff len fields and params %d %d for fields: %s and handleInfo: %s",
                          len(fields), len(handleInfo.wrapperParams), fields,
                          handleInfo)
             return
 
-        fieldIdx = nIgnoreFields
-        args = []
-        for (pname, param) in handleInfo.wrapperParams.items():
-            if pname != "self":
-                logger.debug("field %s ", fields[fieldIdx])
-                try:
-                    arg = fields[fieldIdx].decode('UTF-8')
-                except UnicodeDecodeError:
-                    arg = fields[fieldIdx].decode('latin-1')
-                logger.debug("arg %s type %s", arg, param.annotation)
-                if param.annotation is int:
-                    arg = int(arg)
-                elif param.annotation is float:
-                    arg = float(arg)
-
-                args.append(arg)
-                fieldIdx += 1
+        args = [conv(field) for (conv, field) in
+                zip(handleInfo.argConverters, fields[nIgnoreFields:])]
 
         method = getattr(self.wrapper, handleInfo.wrapperMeth.__name__)
-        logger.debug("calling %s with %s %s", method, self.wrapper, args)
+        if utils.HOT_PATH_LOGGING:
+            logger.debug("calling %s with %s %s", method, self.wrapper, args)
         method(*args)
 
     def interpret(self, fields):
@@ -1269,12 +1512,19 @@ class Decoder(Object):
         handleInfo = self.msgId2handleInfo.get(nMsgId, None)
 
         if handleInfo is None:
-            logger.debug("%s: no handleInfo", fields)
+            if utils.HOT_PATH_LOGGING:
+                logger.debug("%s: no handleInfo", fields)
             return
 
         try:
-            if handleInfo.wrapperMeth is not None:
-                logger.debug("In interpret(), handleInfo: %s", handleInfo)
+            fastMeth = self.msgId2fastMeth.get(nMsgId) if self.fastDecode else None
+            if self.batchHistorical and nMsgId in self.msgId2batchMeth:
+                fastMeth = self.msgId2batchMeth[nMsgId]
+            if fastMeth is not None:
+                fastMeth(self, fields)
+            elif handleInfo.wrapperMeth is not None:
+                if utils.HOT_PATH_LOGGING:
+                    logger.debug("In interpret(), handleInfo: %s", handleInfo)
                 self.interpretWithSignature(fields, handleInfo)
             elif handleInfo.processMeth is not None:
                 handleInfo.processMeth(self, iter(fields))
@@ -1365,5 +1615,18 @@ class Decoder(Object):
         IN.COMPLETED_ORDERS_END: HandleInfo(proc=processCompletedOrdersEndMsg)
 }
 
-
-
+    msgId2fastMeth = {
+        IN.TICK_PRICE: fastTickPriceMsg,
+        IN.TICK_SIZE: fastTickSizeMsg,
+        IN.ORDER_STATUS: fastOrderStatusMsg,
+        IN.MARKET_DEPTH_L2: fastMarketDepthL2Msg,
+        IN.REAL_TIME_BARS: fastRealTimeBarMsg,
+        IN.TICK_BY_TICK: fastTickByTickMsg,
+    }
+
+    msgId2batchMeth = {
+        IN.HISTORICAL_DATA: batchHistoricalDataMsg,
+        IN.HISTORICAL_TICKS: batchHistoricalTicks,
+        IN.HISTORICAL_TICKS_BID_ASK: batchHistoricalTicksBidAsk,
+        IN.HISTORICAL_TICKS_LAST: batchHistoricalTicksLast,
+    }
@@ -12,9 +12,11 @@ remove the size prefix and put the rest in a Queue.
 """
 
 import logging
-from threading import Thread
+import socket
+import selectors
+from threading import (Thread, Lock)
 
-from ibapi import comm
+from ibapi import (comm, utils)
 
 
 logger = logging.getLogger(__name__)
@@ -25,29 +27,139 @@ class EReader(Thread):
         super().__init__()
         self.conn = conn
         self.msg_queue = msg_queue
+        self.buf = comm.FrameBuffer()
 
     def run(self):
         try:
-            buf = b""
             while self.conn.isConnected():
 
-                data = self.conn.recvMsg()
-                logger.debug("reader loop, recvd size %d", len(data))
-                buf += data
+                nRecvd = self.conn.recvMsgInto(self.buf)
+                if utils.HOT_PATH_LOGGING:
+                    logger.debug("reader loop, recvd size %d", nRecvd)
 
-                while len(buf) > 0:
-                    (size, msg, buf) = comm.read_msg(buf)
-                    #logger.debug("resp %s", buf.decode('ascii'))
-                    logger.debug("size:%d msg.size:%d msg:|%s| buf:%s|", size,
-                        len(msg), buf, "|")
+                for (size, msg) in self.buf.frames():
+                    if utils.HOT_PATH_LOGGING:
+                        logger.debug("size:%d msg.size:%d pending:%d", size,
+                            len(msg), len(self.buf))
+                    # the frame is a view into self.buf, copy it out before
+                    # handing it over to the client thread
+                    self.msg_queue.put(bytes(msg))
 
-                    if msg:
-                        self.msg_queue.put(msg)
-                    else:
-                        logger.debug("more incoming packet(s) are needed ")
-                        break
+                if len(self.buf) > 0 and utils.HOT_PATH_LOGGING:
+                    logger.debug("more incoming packet(s) are needed ")
 
             logger.debug("EReader thread finished")
         except:
             logger.exception('unhandled exception in EReader thread')
 
+
+class ESelectorReader:
+    """ EReader flavour that serves any number of Connections from a single
+    thread: it waits on all the sockets with a selector (epoll where
+    available) and puts each framed msg onto the owning client's queue.
+    Share one instance between clients with EClient(selectorReader=...).
+    The thread is started by the first register(), and started again by a
+    later one if it has stopped. """
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.lock = Lock()
+        self.thread = None
+        self.pending = []   # (conn, msg_queue) waiting to be registered
+        self.conns = {}     # fd -> conn
+        self.done = False
+        (self.wakeup_r, self.wakeup_w) = socket.socketpair()
+        self.wakeup_r.setblocking(False)
+        self.selector.register(self.wakeup_r, selectors.EVENT_READ)
+
+    def register(self, conn, msg_queue):
+        with self.lock:
+            self.pending.append((conn, msg_queue))
+            self.done = False
+            if not self.is_alive():
+                self.thread = Thread(target=self.run, name="ESelectorReader", daemon=True)
+                self.thread.start()
+        self.wakeup_w.send(b"\0")
+
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def join(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def stop(self):
+        self.done = True
+        self.wakeup_w.send(b"\0")
+
+    def _unregister_closed(self):
+        for (fd, conn) in list(self.conns.items()):
+            if not conn.isConnected():
+                logger.debug("unregistering fd %d", fd)
+                # the socket may be closed already, unregister by fd
+                self.selector.unregister(fd)
+                del self.conns[fd]
+
+    def _register_pending(self):
+        with self.lock:
+            (pending, self.pending) = (self.pending, [])
+        for (conn, msg_queue) in pending:
+            sock = conn.socket
+            if sock is None:
+                continue
+            try:
+                fd = sock.fileno()
+                if fd in self.conns:
+                    # fd reused, the connection that had it is closed
+                    self.selector.unregister(fd)
+                    del self.conns[fd]
+                self.selector.register(fd, selectors.EVENT_READ,
+                                       (conn, msg_queue, comm.FrameBuffer()))
+            except (OSError, ValueError):
+                # closed while waiting to be registered
+                logger.warning("selector reader, could not register a connection", exc_info=True)
+                conn.disconnect()
+                continue
+            self.conns[fd] = conn
+
+    def _read(self, key):
+        # one recv on a readable connection. An error only drops that
+        # connection, the others are still served
+        (conn, msg_queue, buf) = key.data
+        try:
+            nRecvd = conn.recvMsgInto(buf, drain=False)
+        except OSError:
+            logger.warning("selector reader, fd %d: connection error, disconnecting",
+                           key.fd, exc_info=True)
+            conn.disconnect()
+            nRecvd = 0
+        if utils.HOT_PATH_LOGGING:
+            logger.debug("selector reader, fd %d recvd size %d", key.fd, nRecvd)
+        for (size, msg) in buf.frames():
+            msg_queue.put(bytes(msg))
+
+    def run(self):
+        try:
+            while True:
+                with self.lock:
+                    if self.done and not self.pending:
+                        # a register() from now on starts a new thread
+                        self.thread = None
+                        break
+                for (key, _) in self.selector.select(timeout=1):
+                    if key.fileobj is self.wakeup_r:
+                        try:
+                            self.wakeup_r.recv(4096)
+                        except BlockingIOError:
+                            pass
+                        continue
+                    self._read(key)
+
+                self._unregister_closed()
+                self._register_pending()
+
+            logger.debug("ESelectorReader thread finished")
+        except:
+            logger.exception('unhandled exception in ESelectorReader thread')
+            with self.lock:
+                self.thread = None
@@ -9,6 +9,7 @@ Collection of misc tools
 """
 
 
+import os
 import sys
 import logging
 import inspect
@@ -19,6 +20,32 @@ from ibapi.common import UNSET_INTEGER, UNSET_DOUBLE, UNSET_LONG
 logger = logging.getLogger(__name__)
 
 
+# Per msg (or per field) debug logging on the hot path: framing, socket
+# reads/writes, the client msg loop, Decoder.interpret() and decode().
+# When off those calls are skipped altogether, arguments included, instead
+# of being built and then filtered out by the logger level.
+HOT_PATH_LOGGING = os.environ.get("IBAPI_HOT_PATH_LOGGING", "1") != "0"
+
+# Sampled trace of the raw incoming msgs, independent of HOT_PATH_LOGGING:
+# 1 in WIRE_TRACE_EVERY msgs is logged to the "ibapi.wiretrace" logger at
+# DEBUG level. 0 turns it off.
+WIRE_TRACE_EVERY = int(os.environ.get("IBAPI_WIRE_TRACE_EVERY", "0"))
+wireLogger = logging.getLogger("ibapi.wiretrace")
+
+
+def setHotPathLogging(enabled:bool):
+    global HOT_PATH_LOGGING
+    HOT_PATH_LOGGING = enabled
+
+
+def setWireTrace(every:int):
+    global WIRE_TRACE_EVERY
+    WIRE_TRACE_EVERY = every
+    if every:
+        # let the samples through whatever the root logger level is
+        wireLogger.setLevel(logging.DEBUG)
+
+
 # I use this just to visually emphasize it's a wrapper overriden method
 def iswrapper(fn):
     return fn
@@ -63,7 +90,8 @@ def decode(the_type, fields, show_unset = False):
     except StopIteration:
         raise BadMessage("no more fields")
 
-    logger.debug("decode %s %s", the_type, s)
+    if HOT_PATH_LOGGING:
+        logger.debug("decode %s %s", the_type, s)
 
     if the_type is str:
         if type(s) is str:
@@ -346,6 +346,17 @@ class EWrapper:
         self.logAnswer(current_fn_name(), vars())
 
 
+    def historicalDataBatch(self, reqId:int, arrays:dict):
+        """ returns all the requested historical data bars at once, in place
+        of the historicalData() calls, when the client was created with
+        batchHistorical=True.
+
+        arrays - dict of numpy column arrays: date, open, high, low, close,
+            volume, wap, count """
+
+        self.logAnswer(current_fn_name(), vars())
+
+
     def historicalDataEnd(self, reqId:int, start:str, end:str):
         """ Marks the ending of the historical bars reception. """
         self.logAnswer(current_fn_name(), vars())
@@ -681,6 +692,23 @@ class EWrapper:
         """returns historical tick data when whatToShow=TRADES"""
         self.logAnswer(current_fn_name(), vars())
 
+    def historicalTicksBatch(self, reqId: int, arrays: dict, done: bool):
+        """historicalTicks() as numpy column arrays (time, price, size),
+        when the client was created with batchHistorical=True"""
+        self.logAnswer(current_fn_name(), vars())
+
+    def historicalTicksBidAskBatch(self, reqId: int, arrays: dict, done: bool):
+        """historicalTicksBidAsk() as numpy column arrays (time, mask,
+        priceBid, priceAsk, sizeBid, sizeAsk), when the client was created
+        with batchHistorical=True"""
+        self.logAnswer(current_fn_name(), vars())
+
+    def historicalTicksLastBatch(self, reqId: int, arrays: dict, done: bool):
+        """historicalTicksLast() as numpy column arrays (time, mask, price,
+        size, exchange, specialConditions), when the client was created
+        with batchHistorical=True"""
+        self.logAnswer(current_fn_name(), vars())
+
     def tickByTickAllLast(self, reqId: int, tickType: int, time: int, price: float,
                           size: int, tickAttribLast: TickAttribLast, exchange: str,
                           specialConditions: str):
@@ -0,0 +1,623 @@
+import os
+import csv
+import glob
+import zlib
+import queue
+import atexit
+import logging
+import threading
+import datetime as dt
+import time as _time
+
+import numpy as np
+
+
+class CsvJournal:
+    """
+        Append-only CSV file, written by a background thread
+
+        write() only queues the rows, so the trading threads never wait on
+        the disk. The writer thread batches them, and writes a batch once
+        batch_rows rows are pending or flush_secs after the oldest one was
+        queued, whichever is first. It is the only writer of the file, and
+        the rows of each write() go out together, so rows from different
+        threads never interleave.
+
+        Use open_journal() to share one journal per file across the apps.
+
+        Arguments
+        ---------
+        path (str):         CSV file. Appended to if it exists
+        header (tuple):     column names, written to a new file. An existing
+            file gets an empty separator row instead
+        batch_rows (int):   pending rows that trigger a write
+        flush_secs (float): max time a row stays pending
+        fsync (bool):       fsync after each write, so the rows survive a crash
+            of the host and not only of the app
+    """
+
+    _FLUSH = object()
+    _CLOSE = object()
+
+    def __init__(self, path, header=None, batch_rows=256, flush_secs=1.0, fsync=False):
+        self.path = path
+        self.batch_rows = batch_rows
+        self.flush_secs = flush_secs
+        self.fsync = fsync
+        self.logger = logging.getLogger(__name__)
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if header is not None:
+            if os.path.exists(path):
+                self.write((('',)*len(header),))
+            else:
+                self.write((header,))
+        self._thread = threading.Thread(target=self._run, name=f'journal-{os.path.basename(path)}', daemon=True)
+        self._thread.start()
+
+    def write(self, rows):
+        # Queue rows (a sequence of rows) to be appended together
+        self._queue.put(rows)
+
+    def flush(self, timeout=None):
+        # Block until everything queued so far is on disk
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put((CsvJournal._FLUSH, done))
+        return done.wait(timeout)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(CsvJournal._CLOSE)
+        self._thread.join()
+
+    def _run(self):
+        pending = []
+        n_pending = 0
+        deadline = None
+        with open(self.path, 'a') as csvfile:
+            csvwriter = csv.writer(csvfile)
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - _time.monotonic())
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+                flush_done = None
+                if item is CsvJournal._CLOSE:
+                    pass
+                elif type(item) is tuple and len(item) == 2 and item[0] is CsvJournal._FLUSH:
+                    flush_done = item[1]
+                elif item is not None:
+                    pending.append(item)
+                    n_pending += len(item)
+                    if deadline is None:
+                        deadline = _time.monotonic() + self.flush_secs
+                    if n_pending < self.batch_rows and _time.monotonic() < deadline:
+                        continue
+                if pending:
+                    self._write(csvfile, csvwriter, pending)
+                pending = []
+                n_pending = 0
+                deadline = None
+                if flush_done is not None:
+                    flush_done.set()
+                if item is CsvJournal._CLOSE:
+                    return
+
+    def _write(self, csvfile, csvwriter, batch):
+        try:
+            for rows in batch:
+                csvwriter.writerows(rows)
+            csvfile.flush()
+            if self.fsync:
+                os.fsync(csvfile.fileno())
+        except (OSError, csv.Error):
+            # Keep trading. The rows are lost, the next batch is tried again
+            self.logger.exception(f'Journal write failed - {self.path}, {sum(len(rows) for rows in batch)} rows')
+
+
+class EventJournal:
+    """
+        Binary journal of a symbol's market data, candles, orders and fills
+
+        Events are fixed size EVENT_DTYPE records, appended to preallocated,
+        memory-mapped segment files, one set per local day:
+        directory/<symbol>_<YYYYMMDD>_<seq>.events. An append is a store into
+        the map, with no encoding and no system call, and the OS writes the
+        pages back. Each segment starts with a HEADER_DTYPE header whose count
+        is updated after each record, so readers can map a segment while it
+        is being written, see read_segment() and read_events().
+
+        Record fields by kind (unused ones are 0, or nan for prices)
+            TICK:   code tick type (1 bid, 2 ask, 4 last, MIDPOINT tick-by-tick), close price
+            BAR:    open/high/low/close, size volume
+            CANDLE: open/high/low/close, id bar period, code CandleStore.COLORS ha color
+            ORDER:  id order id, code +1 buy/-1 sell, size, close limit price
+            FILL:   id order id, code +1 bought/-1 sold, size shares, close price
+
+        Arguments
+        ---------
+        directory (str):       directory of the segment files
+        symbol (str):          symbol journaled
+        segment_records (int): records per segment file
+    """
+
+    TICK, BAR, CANDLE, ORDER, FILL = 1, 2, 3, 4, 5
+    KIND_NAMES = {TICK: 'tick', BAR: 'bar', CANDLE: 'candle', ORDER: 'order', FILL: 'fill'}
+    MIDPOINT = -1 # TICK code of tick-by-tick midpoints
+    MAGIC = b'IBEVT001'
+    EVENT_DTYPE = np.dtype([
+        ('time', np.float64), ('kind', np.uint8), ('code', np.int8), ('id', np.int64), ('size', np.float64),
+        ('open', np.float64), ('high', np.float64), ('low', np.float64), ('close', np.float64)], align=True)
+    HEADER_DTYPE = np.dtype({
+        'names': ['magic', 'record_size', 'capacity', 'count'],
+        'formats': ['S8', np.uint32, np.uint32, np.uint64],
+        'itemsize': 64})
+
+    def __init__(self, directory, symbol, segment_records=1 << 16):
+        self.directory = directory
+        self.symbol = symbol
+        self.segment_records = segment_records
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self._map = None
+        self._header = None
+        self._records = None
+        self._count = 0
+        self._capacity = 0
+        self._seq = 0
+        self._day_end = 0.0 # Epoch secs the current day's segments end at
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, kind, time, code=0, id=0, size=0.0, open=np.nan, high=np.nan, low=np.nan, close=np.nan):
+        with self.lock:
+            if time >= self._day_end:
+                self._open_day(time)
+            elif self._count == self._capacity:
+                self._open_segment(self._seq + 1)
+            self._records[self._count] = (time, kind, code, id, size, open, high, low, close)
+            self._count += 1
+            # Published after the record, for readers of the live segment
+            self._header['count'] = self._count
+
+    def _open_day(self, time):
+        day = dt.date.fromtimestamp(time)
+        self._day = day.strftime('%Y%m%d')
+        self._day_end = dt.datetime.combine(day + dt.timedelta(days=1), dt.time()).timestamp()
+        # Carry on with the day's last segment, after a restart
+        self._open_segment(len(segment_paths(self.directory, self.symbol, self._day)) or 1)
+
+    def segment_path(self, seq):
+        return os.path.join(self.directory, f'{self.symbol}_{self._day}_{seq:03d}.events')
+
+    def _open_segment(self, seq):
+        self._close_segment()
+        path = self.segment_path(seq)
+        size = EventJournal.HEADER_DTYPE.itemsize + self.segment_records*EventJournal.EVENT_DTYPE.itemsize
+        new = not os.path.exists(path)
+        if new:
+            with open(path, 'wb') as f:
+                if hasattr(os, 'posix_fallocate'):
+                    os.posix_fallocate(f.fileno(), 0, size)
+                else:
+                    f.truncate(size)
+        self._map = np.memmap(path, dtype=np.uint8, mode='r+')
+        # Plain ndarray views of the map, for cheaper stores
+        mapped = np.asarray(self._map)
+        self._header = mapped[:EventJournal.HEADER_DTYPE.itemsize].view(EventJournal.HEADER_DTYPE)[0]
+        if new:
+            self._header['magic'] = EventJournal.MAGIC
+            self._header['record_size'] = EventJournal.EVENT_DTYPE.itemsize
+            self._header['capacity'] = self.segment_records
+        self._capacity = int(self._header['capacity'])
+        self._count = int(self._header['count'])
+        self._records = mapped[EventJournal.HEADER_DTYPE.itemsize:].view(EventJournal.EVENT_DTYPE)[:self._capacity]
+        self._seq = seq
+        if self._count == self._capacity:
+            # Left full by an earlier run
+            self._open_segment(seq + 1)
+
+    def _close_segment(self):
+        if self._map is not None:
+            self._map.flush()
+            self._map = self._header = self._records = None
+
+    def flush(self, timeout=None):
+        # Write the mapped pages back now, rather than when the OS does
+        with self.lock:
+            if self._map is not None:
+                self._map.flush()
+        return True
+
+    def close(self):
+        with self.lock:
+            self._close_segment()
+            self._day_end = 0.0
+
+
+def segment_paths(directory, symbol, day):
+    # EventJournal segment files of symbol on day (date or YYYYMMDD), in order
+    if isinstance(day, dt.date):
+        day = day.strftime('%Y%m%d')
+    return sorted(glob.glob(os.path.join(glob.escape(directory), f'{glob.escape(symbol)}_{day}_[0-9][0-9][0-9].events')))
+
+
+def read_segment(path):
+    """
+        Records of an EventJournal segment, as a read-only memory map of
+        EVENT_DTYPE records. Only the records written so far are included
+    """
+    header = np.fromfile(path, dtype=EventJournal.HEADER_DTYPE, count=1)
+    if not len(header) or header[0]['magic'] != EventJournal.MAGIC:
+        raise ValueError(f'Not an event journal segment: {path}')
+    if header[0]['record_size'] != EventJournal.EVENT_DTYPE.itemsize:
+        raise ValueError(f'Unsupported record size {header[0]["record_size"]}: {path}')
+    count = int(header[0]['count'])
+    if not count:
+        return np.empty(0, dtype=EventJournal.EVENT_DTYPE)
+    return np.memmap(path, dtype=EventJournal.EVENT_DTYPE, mode='r', offset=EventJournal.HEADER_DTYPE.itemsize, shape=(count,))
+
+
+def read_events(directory, symbol, day, kind=None):
+    """
+        A day of a symbol's events, see EventJournal
+
+        Arguments
+        ---------
+        day (date/str): local day, as a date or YYYYMMDD
+        kind (int):     only events of this EventJournal kind (TICK, BAR..). All if None
+
+        Returns EVENT_DTYPE records, oldest first. A memory map if the day
+        fits in one segment and kind is None, else a copy
+    """
+    segments = [read_segment(path) for path in segment_paths(directory, symbol, day)]
+    if not segments:
+        events = np.empty(0, dtype=EventJournal.EVENT_DTYPE)
+    elif len(segments) == 1:
+        events = segments[0]
+    else:
+        events = np.concatenate(segments)
+    if kind is not None:
+        events = events[events['kind'] == kind]
+    return events
+
+
+class ColumnArchive:
+    """
+        Append-only file of zlib compressed column chunks, with a chunk index
+
+        Rows of `dtype` are buffered in preallocated column arrays, and
+        written as a chunk when chunk_rows rows are buffered or the chunk
+        spans chunk_secs. Each column of a chunk is compressed on its own. A
+        fixed size index record per chunk, in path + '.idx', gives its time
+        span and the offset and compressed size of each column, so a reader
+        only decompresses the chunks, and the columns, it needs. See
+        read_archive().
+
+        Full chunks are compressed and written by a background thread, at
+        most max_pending chunks behind, which bounds memory. The index
+        record is written after the chunk, so a crash never leaves an index
+        pointing past the data.
+
+        Arguments
+        ---------
+        path (str):         data file. Appended to if it exists
+        dtype (np.dtype):   row dtype. Its first field is the time, in epoch secs
+        chunk_rows (int):   max rows per chunk
+        chunk_secs (float): max time span of a chunk
+        max_pending (int):  chunks buffered for the writer thread before append() waits
+        level (int):        zlib compression level
+    """
+
+    _CLOSE = object()
+
+    def __init__(self, path, dtype, chunk_rows=16384, chunk_secs=60.0, max_pending=4, level=1):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.index_dtype = archive_index_dtype(self.dtype)
+        self.chunk_rows = chunk_rows
+        self.chunk_secs = chunk_secs
+        self.level = level
+        self.logger = logging.getLogger(__name__)
+        self._time_field = self.dtype.names[0]
+        self._buffer = np.empty(chunk_rows, dtype=self.dtype)
+        self._n = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name=f'archive-{os.path.basename(path)}', daemon=True)
+        self._thread.start()
+
+    def append(self, row):
+        # row: tuple in dtype field order
+        if self._n and row[0] - self._buffer[self._time_field][0] >= self.chunk_secs:
+            self._seal()
+        self._buffer[self._n] = row
+        self._n += 1
+        if self._n == self.chunk_rows:
+            self._seal()
+
+    def _seal(self):
+        # Hand the buffered rows to the writer thread, and start a new buffer
+        if not self._n:
+            return
+        chunk = self._buffer[:self._n]
+        self._buffer = np.empty(self.chunk_rows, dtype=self.dtype)
+        self._n = 0
+        self._queue.put(chunk)
+
+    def _run(self):
+        with open(self.path, 'ab') as data, open(self.path + '.idx', 'ab') as index:
+            offset = data.tell()
+            while True:
+                chunk = self._queue.get()
+                if chunk is ColumnArchive._CLOSE:
+                    return
+                try:
+                    offset = self._write_chunk(data, index, offset, chunk)
+                except OSError:
+                    # Keep recording. The chunk is lost
+                    self.logger.exception(f'Archive write failed - {self.path}, {len(chunk)} rows')
+                    offset = data.seek(0, os.SEEK_END)
+
+    def _write_chunk(self, data, index, offset, chunk):
+        entry = np.zeros(1, dtype=self.index_dtype)
+        times = chunk[self._time_field]
+        entry['t_first'] = times.min()
+        entry['t_last'] = times.max()
+        entry['rows'] = len(chunk)
+        entry['offset'] = offset
+        for i, name in enumerate(self.dtype.names):
+            block = zlib.compress(np.ascontiguousarray(chunk[name]).tobytes(), self.level)
+            entry['sizes'][0, i] = len(block)
+            data.write(block)
+        data.flush()
+        index.write(entry.tobytes())
+        index.flush()
+        return offset + int(entry['sizes'].sum())
+
+    def flush(self, timeout=None):
+        # Seal the buffered rows into a chunk. Written by the writer thread
+        self._seal()
+        return True
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._seal()
+        self._queue.put(ColumnArchive._CLOSE)
+        self._thread.join()
+
+
+def archive_index_dtype(dtype):
+    return np.dtype([
+        ('t_first', np.float64), ('t_last', np.float64), ('rows', np.uint64), ('offset', np.uint64),
+        ('sizes', np.uint64, (len(dtype.names),))])
+
+
+def read_archive(path, dtype, start=None, stop=None, columns=None):
+    """
+        Rows of a ColumnArchive file with time in [start, stop)
+
+        Only the chunks overlapping [start, stop) are read, and of those
+        only the columns asked for. Returns a structured array of the
+        columns (all of dtype if None), time first, in write order
+    """
+    dtype = np.dtype(dtype)
+    time_field = dtype.names[0]
+    columns = [time_field] + [c for c in (columns or dtype.names) if c != time_field]
+    out_dtype = np.dtype([(c, dtype.fields[c][0]) for c in columns])
+    index_path = path + '.idx'
+    if not os.path.exists(index_path):
+        return np.empty(0, dtype=out_dtype)
+    index = np.fromfile(index_path, dtype=archive_index_dtype(dtype))
+    selected = np.ones(len(index), dtype=bool)
+    if start is not None:
+        selected &= index['t_last'] >= start
+    if stop is not None:
+        selected &= index['t_first'] < stop
+    index = index[selected]
+    out = np.empty(int(index['rows'].sum()), dtype=out_dtype)
+    col_idx = [dtype.names.index(c) for c in columns]
+    pos = 0
+    with open(path, 'rb') as data:
+        for entry in index:
+            n = int(entry['rows'])
+            starts = int(entry['offset']) + np.r_[0, np.cumsum(entry['sizes'])[:-1]]
+            for c, i in zip(columns, col_idx):
+                data.seek(int(starts[i]))
+                block = zlib.decompress(data.read(int(entry['sizes'][i])))
+                out[c][pos:pos + n] = np.frombuffer(block, dtype=out_dtype.fields[c][0], count=n)
+            pos += n
+    if start is not None or stop is not None:
+        times = out[time_field]
+        keep = np.ones(len(out), dtype=bool)
+        if start is not None:
+            keep &= times >= start
+        if stop is not None:
+            keep &= times < stop
+        out = out[keep]
+    return out
+
+
+class TickRecorder:
+    """
+        Daily archives of a symbol's live ticks and 5s bars, to build
+        backtest data from
+
+        One ColumnArchive per stream and local day:
+        directory/<symbol>_<YYYYMMDD>_ticks.cols (TICK_DTYPE: tickPrice and
+        tickSize updates, field being the IB tick type) and
+        directory/<symbol>_<YYYYMMDD>_bars.cols (BAR_DTYPE: real-time bars).
+        See read_ticks() and read_bars().
+
+        Arguments
+        ---------
+        directory (str):        directory of the archives
+        symbol (str):           symbol recorded
+        bar_chunk_secs (float): chunk_secs of the bars. Longer than for the
+            ticks, as there are only 12 bars a minute
+        kwargs:                 ColumnArchive options
+    """
+
+    TICK_DTYPE = np.dtype([('time', np.float64), ('field', np.int8), ('value', np.float64)])
+    BAR_DTYPE = np.dtype([
+        ('time', np.float64), ('open', np.float64), ('high', np.float64), ('low', np.float64),
+        ('close', np.float64), ('volume', np.float64), ('wap', np.float64), ('count', np.int64)])
+
+    def __init__(self, directory, symbol, bar_chunk_secs=3600.0, **kwargs):
+        self.directory = directory
+        self.symbol = symbol
+        self.bar_chunk_secs = bar_chunk_secs
+        self.kwargs = kwargs
+        self.lock = threading.Lock()
+        self._ticks = None
+        self._bars = None
+        self._day_end = 0.0
+
+    def tick(self, time, field, value):
+        with self.lock:
+            if time >= self._day_end:
+                self._open_day(time)
+            self._ticks.append((time, field, value))
+
+    def bar(self, time, open, high, low, close, volume, wap, count):
+        with self.lock:
+            if time >= self._day_end:
+                self._open_day(time)
+            self._bars.append((time, open, high, low, close, volume, wap, count))
+
+    def _open_day(self, time):
+        self._close_day()
+        day = dt.date.fromtimestamp(time)
+        self._day_end = dt.datetime.combine(day + dt.timedelta(days=1), dt.time()).timestamp()
+        self._ticks = ColumnArchive(
+            archive_path(self.directory, self.symbol, day, 'ticks'), TickRecorder.TICK_DTYPE, **self.kwargs)
+        self._bars = ColumnArchive(
+            archive_path(self.directory, self.symbol, day, 'bars'), TickRecorder.BAR_DTYPE,
+            **dict(self.kwargs, chunk_secs=self.bar_chunk_secs))
+
+    def _close_day(self):
+        for archive in (self._ticks, self._bars):
+            if archive is not None:
+                archive.close()
+        self._ticks = self._bars = None
+
+    def flush(self, timeout=None):
+        with self.lock:
+            for archive in (self._ticks, self._bars):
+                if archive is not None:
+                    archive.flush()
+        return True
+
+    def close(self):
+        with self.lock:
+            self._close_day()
+            self._day_end = 0.0
+
+
+def archive_path(directory, symbol, day, stream):
+    if isinstance(day, dt.date):
+        day = day.strftime('%Y%m%d')
+    return os.path.join(directory, f'{symbol}_{day}_{stream}.cols')
+
+
+def read_ticks(directory, symbol, day, start=None, stop=None, columns=None):
+    # Recorded ticks of symbol on day (date or YYYYMMDD), see TickRecorder and read_archive()
+    return read_archive(archive_path(directory, symbol, day, 'ticks'), TickRecorder.TICK_DTYPE, start, stop, columns)
+
+
+def read_bars(directory, symbol, day, start=None, stop=None, columns=None):
+    # Recorded real-time bars of symbol on day, see read_ticks()
+    return read_archive(archive_path(directory, symbol, day, 'bars'), TickRecorder.BAR_DTYPE, start, stop, columns)
+
+
+_journals = {} # abs path (, symbol) -> CsvJournal/EventJournal/TickRecorder
+_journals_lock = threading.Lock()
+_claims = {} # key -> owner, see claim_events()
+
+
+def open_journal(path, header=None, **kwargs):
+    # The process wide CsvJournal of path. Options are taken from the first call
+    key = os.path.abspath(path)
+    with _journals_lock:
+        journal = _journals.get(key)
+        if journal is None:
+            journal = _journals[key] = CsvJournal(path, header, **kwargs)
+        return journal
+
+
+def open_events(directory, symbol, **kwargs):
+    # The process wide EventJournal of symbol in directory
+    key = (os.path.abspath(directory), symbol)
+    with _journals_lock:
+        journal = _journals.get(key)
+        if journal is None:
+            journal = _journals[key] = EventJournal(directory, symbol, **kwargs)
+        return journal
+
+
+def _claim(key, owner):
+    # True if key is free or already owner's, and then owner's
+    with _journals_lock:
+        holder = _claims.setdefault(key, owner)
+    if holder is not owner:
+        logging.getLogger(__name__).warning(f'Journal claimed by another app - {key[0]}, {key[2]}, {key[1]}')
+        return False
+    return True
+
+
+def claim_events(directory, symbol, owner, **kwargs):
+    # The EventJournal of symbol in directory, as open_events(), for one owner
+    # at a time. None for the others: the ticks and bars of a symbol are
+    # journaled by one app, the candles, orders and fills by each app. The
+    # owner gets it again on later calls, until release_claims()
+    if not _claim(('market', os.path.abspath(directory), symbol), owner):
+        return None
+    return open_events(directory, symbol, **kwargs)
+
+
+def claim_recorder(directory, symbol, owner, **kwargs):
+    # The TickRecorder of symbol in directory, for one owner at a time, see
+    # claim_events(). So ticks from several apps of a symbol are recorded once
+    key = ('ticks', os.path.abspath(directory), symbol)
+    if not _claim(key, owner):
+        return None
+    with _journals_lock:
+        recorder = _journals.get(key)
+        if recorder is None:
+            recorder = _journals[key] = TickRecorder(directory, symbol, **kwargs)
+        return recorder
+
+
+def release_claims(owner):
+    # Give up owner's claims, for the next app of the symbol. The journals stay open
+    with _journals_lock:
+        for key in [key for (key, holder) in _claims.items() if holder is owner]:
+            del _claims[key]
+
+
+def flush_journals(timeout=None):
+    with _journals_lock:
+        journals = list(_journals.values())
+    for journal in journals:
+        journal.flush(timeout)
+
+
+@atexit.register
+def close_journals():
+    with _journals_lock:
+        journals = list(_journals.values())
+        _journals.clear()
+        _claims.clear()
+    for journal in journals:
+        journal.close()
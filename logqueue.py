@@ -0,0 +1,110 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import datetime as dt
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+        QueueHandler that leaves all formatting to the listener thread
+
+        The stock QueueHandler formats each record before queueing it, in
+        the thread that logs. Here the record is queued as is, so the
+        logging thread only pays for the record and the put. The args are
+        formatted later, so must not be changed after the call: pass
+        numbers, strings, tuples, or LocalTime for epoch times.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """
+        Lets through at most `rate` records per `interval` secs of each
+        logger and message, and drops the rest
+
+        The next record let through after some were dropped ends with their
+        count. Counts are approximate when several threads log the same
+        message at once, which is fine for per-tick noise.
+
+        Arguments
+        ---------
+        rate (int):       records per interval. 0 for no limit
+        interval (float): secs
+    """
+
+    def __init__(self, rate=10, interval=1.0):
+        super().__init__()
+        self.rate = rate
+        self.interval = interval
+        self._windows = {} # (logger name, msg) -> [window start, passed, dropped]
+
+    def filter(self, record):
+        if not self.rate:
+            return True
+        key = (record.name, record.msg)
+        window = self._windows.get(key)
+        if window is None or record.created - window[0] >= self.interval:
+            self._windows[key] = [record.created, 1, 0]
+            if window is not None and window[2] and isinstance(record.args, tuple):
+                record.msg = f'{record.msg} (%d dropped)'
+                record.args = record.args + (window[2],)
+            return True
+        if window[1] < self.rate:
+            window[1] += 1
+            return True
+        window[2] += 1
+        return False
+
+
+class LocalTime:
+    # Epoch secs, formatted as a local datetime only when logged
+    __slots__ = ('epoch',)
+
+    def __init__(self, epoch):
+        self.epoch = epoch
+
+    def __str__(self):
+        return str(dt.datetime.fromtimestamp(self.epoch))
+
+
+_tick_filter = RateLimitFilter()
+
+
+def tick_logger(name):
+    # Logger for per-tick/per-bar messages, rate limited, see setup_logging()
+    logger = logging.getLogger(name)
+    if _tick_filter not in logger.filters:
+        logger.addFilter(_tick_filter)
+    return logger
+
+
+def setup_logging(filename=None, level=logging.WARNING, tick_rate=10):
+    """
+        Root logging through a queue, to a file (stderr if filename is None)
+        written by a QueueListener thread
+
+        Used in place of logging.basicConfig(). Logging calls only queue the
+        record, so a slow disk never stalls the message loop, and the
+        formatting is done by the listener. Messages of tick_logger()
+        loggers are limited to tick_rate per sec each (0: no limit).
+
+        Returns the started QueueListener. It is stopped, and the queue
+        drained, at exit
+    """
+    if filename is not None:
+        handler = logging.FileHandler(filename)
+    else:
+        handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+    _tick_filter.rate = tick_rate
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,102 @@
+import importlib
+import logging
+
+
+class Strategy:
+    """
+        Base class of the trading strategies run by MarketDataApp
+
+        A strategy only sees market data and fills through the hooks below,
+        and trades through buy()/sell(). The app owns the connection, the
+        subscriptions and the candles, so any number of strategies can run
+        on one data feed and one CandleStore.
+
+        Arguments
+        ---------
+        symbol (str):     symbol traded
+        period (int):     bar period of the candles passed to on_bar(), in seconds
+        order_size (int): base order size, from --order-size
+    """
+
+    def __init__(self, symbol, period, order_size):
+        self.symbol = symbol
+        self.period = period
+        self.order_size = order_size
+        self.broker = None
+        self.logger = logging.getLogger(__name__)
+
+    def attach(self, broker):
+        # broker places the orders: anything with submit(strategy, side, size)
+        self.broker = broker
+
+    def buy(self, size):
+        return self.broker.submit(self, 'Buy', size)
+
+    def sell(self, size):
+        return self.broker.submit(self, 'Sell', size)
+
+    def on_bar(self, candles):
+        """ A candle closed. candles is the shared candles.CandleStore, newest
+        candle last: candles.color(-1), candles.last('close'), or candles.tail(n)
+        for array views. Not to be modified. """
+        pass
+
+    def on_tick(self, time, price):
+        """ Last trade price update """
+        pass
+
+    def on_fill(self, execution):
+        """ One of this strategy's orders (partially) filled. execution is the
+        ibapi.execution.Execution: orderId, side, shares, price, time.. """
+        pass
+
+
+class HAStrategy(Strategy):
+    """
+        Heikin-Ashi color flips: buy on a Green candle, sell on a Red one
+
+        Indecision candles are skipped. The first order is order_size, later
+        ones twice that, to reverse the position.
+    """
+
+    def __init__(self, symbol, period, order_size):
+        super().__init__(symbol, period, order_size)
+        self.first_order = True # Set to False after first order
+
+    def on_bar(self, candles):
+        if candles.color(-1) is None:
+            # Skip if first HA candle not yet available, or this is an indecision candle
+            return
+        #
+        _side = 'Buy'
+        if candles.color(-1) == 'Red':
+            _side = 'Sell'
+        #
+        if self.first_order:
+            self.broker.submit(self, _side, self.order_size)
+            self.first_order = False
+            self.order_size *= 2
+        elif not candles.color(-1) == candles.color(-2):
+            self.broker.submit(self, _side, self.order_size)
+        else:
+            # Candle color same as previous. Do not place an order
+            return
+
+
+# Names usable with --strategy. Anything else is taken as a module:Class path
+STRATEGIES = {
+    'ha': HAStrategy,
+}
+
+
+def load_strategy(name):
+    # Strategy class from a STRATEGIES name or a "package.module:Class" path
+    if name in STRATEGIES:
+        return STRATEGIES[name]
+    module_name, _, class_name = name.partition(':')
+    if not class_name:
+        raise ValueError(f'Unknown strategy: {name}. Use one of {sorted(STRATEGIES)} or module:Class')
+    cls = getattr(importlib.import_module(module_name), class_name)
+    if not (isinstance(cls, type) and issubclass(cls, Strategy)):
+        raise TypeError(f'{name} is not a Strategy')
+    return cls
@@ -0,0 +1,178 @@
+#!/usr/local/bin/python3
+
+import argparse
+import itertools
+import logging
+import os
+import tempfile
+import time as _time
+import concurrent.futures
+import numpy as np
+import pandas as pd
+
+import backtest
+
+
+# Fill rule of each (order_type, quote_type), see MarketDataApp._create_order_obj().
+# MKT orders ignore the quote type. LMT orders are priced at the last trade
+# or the bid/ask midpoint, both the candle close with a single price series
+FILLS = {
+    ('MKT', 'last'): 'next',
+    ('MKT', 'mid'): 'next',
+    ('LMT', 'last'): 'close',
+    ('LMT', 'mid'): 'close',
+}
+
+
+def _share_one(path, directory):
+    # Worker: parse one symbol's bar file and save its columns as .npy files
+    symbol = os.path.splitext(os.path.basename(path))[0].upper()
+    bars = backtest.load_bars(path)
+    prefix = os.path.join(directory, symbol)
+    for col, array in bars.items():
+        np.save(f'{prefix}.{col}.npy', array)
+    return symbol, prefix, backtest.bar_size_of(bars['time'])
+
+
+def share_bars(executor, files, directory):
+    """
+        Load each symbol's bars once, in parallel, and save them as .npy
+        column files for the workers to memory-map instead of being sent a copy
+
+        Returns {symbol: (path prefix, bar size)}, symbol being the file name stem
+    """
+    shared = {}
+    for (symbol, prefix, bar_size) in executor.map(_share_one, files, itertools.repeat(directory)):
+        shared[symbol] = (prefix, bar_size)
+    return shared
+
+
+def _map_bars(prefix):
+    return {col: np.load(f'{prefix}.{col}.npy', mmap_mode='r')
+            for col in ('time', 'open', 'high', 'low', 'close')}
+
+
+def _sweep_one(symbol, prefix, bar_size, period, combos, order_size, commission, calendar):
+    # Worker: one candle series per (symbol, period), evaluated for every combo
+    bars = _map_bars(prefix)
+    (time, open, close, colors) = backtest.ha_candles(bars, period, bar_size, calendar=calendar)
+    by_fill = {}
+    rows = []
+    for (order_type, quote_type) in combos:
+        fill = FILLS[(order_type, quote_type)]
+        if fill not in by_fill:
+            by_fill[fill] = backtest.evaluate(
+                time, open, close, colors, period, order_size, fill, commission)[1]
+        row = {'symbol': symbol, 'order_type': order_type, 'quote_type': quote_type}
+        row.update(by_fill[fill])
+        rows.append(row)
+    return rows
+
+
+def sweep(files, periods, order_types=('MKT',), quote_types=('last',), order_size=100,
+          commission=0.0, workers=None, rank_by='pnl', calendar=None):
+    """
+        Backtest every symbol x bar_period x order_type x quote_type, on all cores
+
+        Arguments
+        ---------
+        files (list):   bar files, one per symbol, see backtest.load_bars()
+        periods (list): bar periods in seconds
+        workers (int):  worker processes. All CPUs if None
+        rank_by (str):  summary column the results are ranked on, best first
+        calendar (TradingCalendar): where periods are anchored, see backtest.run()
+
+        Returns the ranked results as a DataFrame
+    """
+    combos = list(itertools.product(order_types, quote_types))
+    unknown = [combo for combo in combos if combo not in FILLS]
+    if unknown:
+        raise ValueError(f'Unknown order/quote types: {unknown}')
+    logger = logging.getLogger(__name__)
+    with tempfile.TemporaryDirectory(prefix='sweep_') as directory:
+        rows = []
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            shared = share_bars(executor, files, directory)
+            futures = []
+            for symbol, (prefix, bar_size) in shared.items():
+                for period in periods:
+                    if period % bar_size:
+                        logger.warning(f'Skipped {symbol}, {period}: not a multiple of the bar size {bar_size}')
+                        continue
+                    futures.append(executor.submit(
+                        _sweep_one, symbol, prefix, bar_size, period, combos, order_size, commission, calendar))
+            for future in concurrent.futures.as_completed(futures):
+                rows.extend(future.result())
+    results = pd.DataFrame(rows)
+    if results.empty:
+        return results
+    # Best first: highest, except for drawdown
+    ascending = rank_by == 'max_drawdown'
+    results = results.sort_values(rank_by, ascending=ascending, kind='stable').reset_index(drop=True)
+    results.insert(0, 'rank', np.arange(1, len(results) + 1))
+    return results
+
+
+def main_cli(args):
+    # For running the sweep from the command line
+    t0 = _time.perf_counter()
+    results = sweep(
+        args.files, args.bar_period, args.order_type, args.quote_type, args.order_size,
+        args.commission, args.workers, args.rank_by,
+        backtest.trading_calendar(args.exchange_tz, args.session, args.early_close))
+    results.to_csv(args.out, index=False)
+    print(results.head(args.top).to_string(index=False))
+    print(f'{len(results)} runs in {_time.perf_counter() - t0:.1f}s, written to {args.out}')
+
+
+def parse_args():
+    argp = argparse.ArgumentParser()
+    argp.add_argument("files", type=str, nargs='+', help="CSV or Parquet bar files, one per symbol (named <symbol>.csv)")
+    argp.add_argument(
+        "-b", "--bar-period", type=int, default=[60], nargs='+', help="bar time periods to sweep"
+    )
+    argp.add_argument(
+        "-o", "--order-type", type=str, default=['MKT', 'LMT'], nargs='+',
+        choices=sorted({order_type for (order_type, _) in FILLS}), help="Order types to sweep (MKT/LMT)"
+    )
+    argp.add_argument(
+        "-q", "--quote-type", type=str, default=['mid', 'last'], nargs='+',
+        choices=sorted({quote_type for (_, quote_type) in FILLS}), help="Quote types to sweep (mid/last)"
+    )
+    argp.add_argument(
+        "-s", "--order-size", type=int, default=100, help="Order size"
+    )
+    argp.add_argument(
+        "--commission", type=float, default=0.0, help="Commission per share"
+    )
+    argp.add_argument(
+        "--exchange-tz", type=str, default=None, help="Exchange timezone the candle periods are aligned in, e.g. US/Eastern (default: local time)"
+    )
+    argp.add_argument(
+        "--session", type=str, default=None, nargs=2, metavar=('OPEN', 'CLOSE'), help="Session open and close, HH:MM in the exchange timezone. Candle periods start at the open and end at the close"
+    )
+    argp.add_argument(
+        "--early-close", type=str, default=[], nargs='+', help="Early close days, as YYYY-MM-DD@HH:MM"
+    )
+    argp.add_argument(
+        "-j", "--workers", type=int, default=None, help="Worker processes (default: all CPUs)"
+    )
+    argp.add_argument(
+        "-r", "--rank-by", type=str, default='pnl', help="Result column to rank on (pnl/turnover/fills/max_drawdown..)"
+    )
+    argp.add_argument(
+        "--out", type=str, default='sweep_results.csv', help="CSV file for the ranked results"
+    )
+    argp.add_argument(
+        "--top", type=int, default=20, help="Number of top results to print"
+    )
+
+    args = argp.parse_args()
+    unknown = [combo for combo in itertools.product(args.order_type, args.quote_type) if combo not in FILLS]
+    if unknown:
+        argp.error(f'no fill rule for order/quote types: {", ".join(" ".join(combo) for combo in unknown)}')
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    main_cli(args)
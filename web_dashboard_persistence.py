@@ -10,7 +10,9 @@ import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output, State
 
-from IB_trader import MarketDataApp
+from IB_trader import (MarketDataApp, default_args)
+from ibapi.utils import setHotPathLogging
+from logqueue import setup_logging
 
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
@@ -25,14 +27,12 @@ argp.add_argument(
 args = argp.parse_args()
 
 if args.loglevel == 'info':
-    logging.basicConfig(level=logging.INFO)
+    setup_logging(level=logging.INFO)
 elif args.loglevel == 'warning':
-    logging.basicConfig(level=logging.WARNING)
+    setup_logging(level=logging.WARNING)
 else:
     raise ValueError
-
-class Object(object):
-    pass
+setHotPathLogging(False)
 
 class TraderAction:
     def __init__(self, loglevel):
@@ -105,13 +105,10 @@ class TraderAction:
             logging.info(f'WEB: Thread stopped: {instrument}')
 
     def _make_args(self, instrument):
-        args = Object()
-        args.currency = 'USD'
+        # The IB_trader defaults, but for the args set here
+        args = default_args()
         args.loglevel = 'info'
-        args.debug = False
-        args.exchange = 'SMART'
         args.port = self.port
-        args.security_type = 'STK'
         args.symbol = instrument
         args.order_size = int(self.state[instrument]['args'][0])
         args.bar_period = int(self.state[instrument]['args'][1])